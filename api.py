@@ -10,8 +10,14 @@ from pydantic import BaseModel
 from dotenv import load_dotenv
 from pathlib import Path
 
-from src.agent.plan import PlanAgent
+from src.agent.plan import PlanAgent, lane_stats
+from src.agent.pool import agent_pool
+from src.tool.cache import tool_cache
+from src.agent.plan.cache import get_plan_cache
 from src.inference.vertex_ai import ChatVertexAI
+from src.inference.cascade import CascadeInference
+from src.inference.cassette import RecordingInference, ReplayInference
+from src.router.local import router_stats
 
 load_dotenv()
 
@@ -30,15 +36,48 @@ project_id = os.environ.get("GOOGLE_CLOUD_PROJECT")
 service_account_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "./service-account.json")
 vertex_ai_model = os.environ.get("VERTEX_AI_MODEL", "gemini-1.5-flash")
 vertex_ai_location = os.environ.get("VERTEX_AI_LOCATION", "us-central1")
+structured_output = os.environ.get("STRUCTURED_OUTPUT", "").lower() in ("1", "true", "yes")
+cascade_small_model = os.environ.get("CASCADE_SMALL_MODEL")
 
 llm = ChatVertexAI(
     model=vertex_ai_model,
     project_id=project_id,
     location=vertex_ai_location,
     temperature=0,
-    service_account_path=service_account_path
+    service_account_path=service_account_path,
+    context_cache=os.environ.get("VERTEX_CONTEXT_CACHE", "").lower() in ("1", "true", "yes"),
 )
 
+# Routing and simple plans try the small model first and escalate to the main model when unsure
+if cascade_small_model:
+    llm = CascadeInference(
+        small=ChatVertexAI(
+            model=cascade_small_model,
+            project_id=project_id,
+            location=vertex_ai_location,
+            temperature=0,
+            service_account_path=service_account_path,
+        ),
+        large=llm,
+        threshold=float(os.environ.get("CASCADE_THRESHOLD", "0.6")),
+        samples=int(os.environ.get("CASCADE_SAMPLES", "1")),
+    )
+cascade = llm if isinstance(llm, CascadeInference) else None
+
+# Cassettes: record the LLM calls of real sessions, or replay a recorded session without calling a model
+if os.environ.get("CASSETTE_REPLAY"):
+    llm = ReplayInference(
+        os.environ["CASSETTE_REPLAY"],
+        speed=float(os.environ.get("CASSETTE_SPEED", "1")),
+        match=os.environ.get("CASSETTE_MATCH", "request"),
+    )
+elif os.environ.get("CASSETTE_RECORD"):
+    llm = RecordingInference(
+        llm,
+        os.environ["CASSETTE_RECORD"],
+        store_requests=os.environ.get("CASSETTE_MESSAGES", "").lower() in ("1", "true", "yes"),
+    )
+
 class ChatRequest(BaseModel):
     message: str
 
@@ -82,7 +121,7 @@ async def run_agent(input_text: str, event_queue: asyncio.Queue, session_id: str
             lambda: event_queue.put_nowait({"type": event_type, "content": message, **kwargs})
         )
 
-    agent = PlanAgent(llm=llm, verbose=True, reporter=reporter, interactive_agent=interactive_agent)
+    agent = PlanAgent(llm=llm, structured=structured_output, verbose=True, reporter=reporter, interactive_agent=interactive_agent)
     
     try:
         # Run in thread since invoke is blocking
@@ -105,7 +144,7 @@ async def run_agent(input_text: str, event_queue: asyncio.Queue, session_id: str
 @app.post("/chat")
 async def chat(request: ChatRequest):
     # For simple curl testing
-    agent = PlanAgent(llm=llm, verbose=True)
+    agent = PlanAgent(llm=llm, structured=structured_output, verbose=True)
     response = agent.invoke(request.message)
     return {"response": response}
 
@@ -145,6 +184,26 @@ async def submit_answer(request: dict):
         return {"status": "success"}
     return {"status": "error", "message": "Session not found"}
 
+@app.get("/stats")
+async def stats():
+    """Runtime metrics of the shared agent pool, tool cache, LLM context cache, prompt sizes, model cascade, local router, plan lanes, plan cache and cassette"""
+    return {
+        "agent_pool": agent_pool.stats(),
+        "tool_cache": tool_cache.stats(),
+        "context_cache": llm.cache_stats() if hasattr(llm, "cache_stats") else None,
+        "tokens": llm.token_stats(),
+        "cascade": cascade.stats() if cascade else None,
+        "router": router_stats(),
+        "plan_lanes": lane_stats.stats(),
+        "plan_cache": get_plan_cache().stats(),
+        "cassette": llm.stats() if isinstance(llm, (RecordingInference, ReplayInference)) else None,
+    }
+
+@app.delete("/plan-cache")
+async def invalidate_plan_cache(query: str | None = None):
+    """Drop the cached plans a query would reuse, or all of them without a query"""
+    return {"invalidated": get_plan_cache().invalidate(query)}
+
 @app.get("/download/{filename}")
 async def download_file(filename: str):
     """Download generated files"""
@@ -123,7 +123,7 @@ def terminal_tool(command:str)->str:
 class GoogleSearch(BaseModel):
     query:str=Field(...,description="The search query to be performed.",example=["latest AI news"])
 
-@tool("Google Search Tool",args_schema=GoogleSearch)
+@tool("Google Search Tool",args_schema=GoogleSearch,cacheable=True,ttl=600)
 def google_search_tool(query:str)->str:
     '''
     Performs a Google search for the given query and returns the search results.
@@ -7,6 +7,8 @@ class BaseAgent(ABC):
     def report(self, content, info_type="info"):
         if self._reporter:
             self._reporter(content, info_type)
+    def reset(self, reporter=None):
+        self._reporter = reporter
     @abstractmethod
     def invoke(self,input:str):
         pass
@@ -1,4 +1,5 @@
-from src.agent.cot.utils import extract_llm_response,read_markdown_file
+from src.agent.cot.utils import extract_llm_response,COTStep
+from src.structured import invoke_structured,schema_instructions
 from langchain_core.runnables.graph import MermaidDrawMethod
 from src.message import SystemMessage,HumanMessage
 from src.agent.cot.state import AgentState
@@ -6,21 +7,35 @@ from IPython.display import display,Image
 from src.inference import BaseInference
 from langgraph.graph import StateGraph
 from src.agent import BaseAgent
+from src.prompt import prompts
 from termcolor import colored
 from time import sleep
+from os import environ
 
 class COTAgent(BaseAgent):
-    def __init__(self,name:str='',description:str='',instructions:list[str]=[],llm:BaseInference=None,max_iteration=10,json=False,verbose=False,reporter=None):
+    def __init__(self,name:str='',description:str='',instructions:list[str]=[],llm:BaseInference=None,max_iteration=10,cooldown:float|None=None,structured:bool=False,json=False,verbose=False,reporter=None):
         super().__init__(reporter=reporter)
         self.name=name
         self.description=description
         self.instructions=self.get_instructions(instructions)
         self.llm=llm
         self.max_iteration=max_iteration
+        # Pause before every second LLM call to stay under provider rate limits (0 disables it)
+        self.cooldown=cooldown if cooldown is not None else float(environ.get('LLM_COOLDOWN',0))
+        # Structured mode asks for JSON following COTStep instead of the tag format
+        self.structured=structured
         self.graph=self.create_graph()
         self.verbose=verbose
         self.iteration=0
-        self.system_prompt=read_markdown_file('./src/agent/cot/prompt.md')
+        self.system_prompt=prompts.get('agent/cot/prompt')
+        self.context_prompt=prompts.get('agent/cot/context')
+
+    def reset(self,name:str='',description:str='',instructions:list[str]=[],reporter=None):
+        super().reset(reporter=reporter)
+        self.name=name
+        self.description=description
+        self.instructions=self.get_instructions(instructions)
+        self.iteration=0
 
     def get_instructions(self,instructions):
         return '\n'.join([f'{i+1}. {instruction}' for i,instruction in enumerate(instructions)])
@@ -28,12 +43,15 @@ class COTAgent(BaseAgent):
     def reason(self,state:AgentState):
         messages = state['messages']
         if self.max_iteration>self.iteration:
-            if self.iteration%2!=0:
-                sleep(60) #To prevent from hitting the API rate limit
-            llm_response=self.llm.invoke(messages)
-            # print(llm_response.content)
-            agent_data=extract_llm_response(llm_response.content)
-            messages = messages + [HumanMessage(llm_response.content)]
+            if self.cooldown and self.iteration%2!=0:
+                sleep(self.cooldown)
+            if self.structured:
+                step,content=invoke_structured(self.llm,messages,COTStep,node='cot')
+                agent_data=step.to_dict()
+            else:
+                content=self.llm.invoke(messages,node='cot').content
+                agent_data=extract_llm_response(content)
+            messages = messages + [HumanMessage(content)]
         else:
             agent_data={
                 'Thought':'I reached the iteration limit',
@@ -113,11 +131,15 @@ class COTAgent(BaseAgent):
             'description':self.description,
             'instructions':self.instructions,
         }
-        system_prompt=self.system_prompt.format(**parameters) 
+        # Static prompt first so the backend can cache it, the agent context last
+        system_prompt=self.system_prompt
+        if self.structured:
+            system_prompt+=schema_instructions(COTStep)
+        context=self.context_prompt.format(**parameters)
         user_prompt=f'Query: {input}' 
         state={
             'input':input,
-            'messages':[SystemMessage(system_prompt),HumanMessage(user_prompt)],
+            'messages':[SystemMessage(system_prompt),SystemMessage(context),HumanMessage(user_prompt)],
             'output':'',
         }
         graph_response=self.graph.invoke(state)
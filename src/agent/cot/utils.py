@@ -1,4 +1,6 @@
-import re
+from pydantic import BaseModel,Field
+from typing import Literal,Optional
+from src.parser import parse_tags
 
 def extract_llm_response(xml_output):
     # Dictionary to store extracted data
@@ -9,65 +11,41 @@ def extract_llm_response(xml_output):
         "Final Answer": None,
         "Reflection": None
     }
-    
-    # Clean response from code blocks if present
-    clean_output = re.sub(r'```[a-zA-Z]*\n?', '', xml_output)
-    clean_output = re.sub(r'```', '', clean_output)
-
-    # Define regex patterns for each field - more flexible and case-insensitive
-    route_pattern = re.compile(r'<Route>(.*?)</Route>', re.DOTALL | re.IGNORECASE)
-    thought_pattern = re.compile(r'<Thought>(.*?)</Thought>', re.DOTALL | re.IGNORECASE)
-    observation_pattern = re.compile(r'<Observation>(.*?)</Observation>', re.DOTALL | re.IGNORECASE)
-    final_answer_pattern = re.compile(r'<Final-Answer>(.*?)</Final-Answer>', re.DOTALL | re.IGNORECASE)
-    reflection_pattern = re.compile(r'<Reflection>(.*?)</Reflection>', re.DOTALL | re.IGNORECASE)
-
-    # Extract values based on the patterns
-    route_match = route_pattern.search(clean_output)
-    thought_match = thought_pattern.search(clean_output)
-    observation_match = observation_pattern.search(clean_output)
-    final_answer_match = final_answer_pattern.search(clean_output)
-    reflection_match = reflection_pattern.search(clean_output)
-
-    # Populate the dictionary if values are found
-    if route_match:
-        response_data['Route'] = route_match.group(1).strip()
-        route_val = response_data['Route'].lower()
-
-        # Based on Route, extract the rest of the data
-        if route_val == "reason":
-            if thought_match:
-                response_data['Thought'] = thought_match.group(1).strip()
-            if observation_match:
-                response_data['Observation'] = observation_match.group(1).strip()
-
-        elif route_val == "answer":
-            if thought_match:
-                response_data['Thought'] = thought_match.group(1).strip()
-            if final_answer_match:
-                response_data['Final Answer'] = final_answer_match.group(1).strip()
-
-        elif route_val == "reflection":
-            if thought_match:
-                response_data['Thought'] = thought_match.group(1).strip()
-            if reflection_match:
-                response_data['Reflection'] = reflection_match.group(1).strip()
-    
+    parser = parse_tags(xml_output)
+    route = parser.text('Route')
+    thought = parser.text('Thought')
+
+    # Based on Route, extract the rest of the data
+    if route:
+        response_data['Route'] = route
+        fields = {'reason': 'Observation', 'answer': 'Final Answer', 'reflection': 'Reflection'}
+        field = fields.get(route.lower())
+        if field:
+            response_data['Thought'] = thought
+            response_data[field] = parser.text(field)
     # Fallback if Route is missing but we have Final Answer or Observation
-    if not response_data['Route']:
-        if final_answer_match:
-            response_data['Route'] = 'Answer'
-            response_data['Final Answer'] = final_answer_match.group(1).strip()
-            if thought_match:
-                response_data['Thought'] = thought_match.group(1).strip()
-        elif observation_match:
-            response_data['Route'] = 'Reason'
-            response_data['Observation'] = observation_match.group(1).strip()
-            if thought_match:
-                response_data['Thought'] = thought_match.group(1).strip()
-                
+    elif (final_answer := parser.text('Final Answer')) is not None:
+        response_data.update({'Route': 'Answer', 'Final Answer': final_answer, 'Thought': thought})
+    elif (observation := parser.text('Observation')) is not None:
+        response_data.update({'Route': 'Reason', 'Observation': observation, 'Thought': thought})
+
     return response_data
 
-def read_markdown_file(file_path: str) -> str:
-    with open(file_path, 'r',encoding='utf-8') as f:
-        markdown_content = f.read()
-    return markdown_content
\ No newline at end of file
+class COTStep(BaseModel):
+    '''
+    Schema of one chain-of-thought step for the structured output mode.
+    '''
+    thought: str = Field(..., description='Your reasoning for this step.')
+    observation: Optional[str] = Field(None, description='What you observed for the Reason route.')
+    reflection: Optional[str] = Field(None, description='Your reflection for the Reflection route.')
+    final_answer: Optional[str] = Field(None, description='The final answer in markdown for the Answer route.')
+    route: Literal['Reason', 'Reflection', 'Answer']
+
+    def to_dict(self) -> dict:
+        return {
+            'Route': self.route,
+            'Thought': self.thought,
+            'Observation': self.observation,
+            'Final Answer': self.final_answer,
+            'Reflection': self.reflection
+        }
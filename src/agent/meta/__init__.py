@@ -1,4 +1,5 @@
-from src.agent.meta.utils import extract_from_xml,read_markdown_file
+from src.agent.meta.utils import extract_from_xml,MetaStep
+from src.structured import invoke_structured,schema_instructions
 from langchain_core.runnables.graph import MermaidDrawMethod
 from src.message import SystemMessage,HumanMessage
 from src.agent.meta.state import AgentState
@@ -7,25 +8,44 @@ from IPython.display import display,Image
 from src.inference import BaseInference
 from src.agent.react import ReactAgent
 from src.agent.cot import COTAgent
+from src.agent.pool import agent_pool
+from src.memory import TaskMemory
 from src.agent import BaseAgent
+from src.prompt import prompts
 from termcolor import colored
 
 class MetaAgent(BaseAgent):
-    def __init__(self,llm:BaseInference=None,tools:list=[],max_iteration=10,json=False,verbose=False,reporter=None):
+    def __init__(self,llm:BaseInference=None,tools:list=[],max_iteration=10,structured:bool=False,json=False,verbose=False,reporter=None):
         super().__init__(reporter=reporter)
         self.name='Meta Agent'
         self.llm=llm
         self.max_iteration=max_iteration
         self.iteration=0
         self.tools=tools
+        self.task_memory=TaskMemory()
+        # Structured mode asks for JSON following MetaStep instead of the tag format, the experts inherit it
+        self.structured=structured
         self.graph=self.create_graph()
         self.verbose=verbose
-        self.system_prompt=read_markdown_file('./src/agent/meta/prompt.md')
+        self.system_prompt=prompts.get('agent/meta/prompt')
+
+    def reset(self,reporter=None):
+        super().reset(reporter=reporter)
+        self.iteration=0
 
     def meta_expert(self,state:AgentState):
-        llm_response=self.llm.invoke(state['messages'])
-        # print(llm_response.content)
-        agent_data=extract_from_xml(llm_response.content)
+        if self.structured:
+            step,_=invoke_structured(self.llm,state['messages'],MetaStep,node='meta')
+            agent_data=step.to_dict()
+        else:
+            llm_response=self.llm.invoke(state['messages'],node='meta')
+            agent_data=extract_from_xml(llm_response.content)
+        return {**state,'agent_data':agent_data,'messages':[HumanMessage(self.dispatch(agent_data))]}
+
+    def dispatch(self,agent_data:dict)->str:
+        '''
+        Reports the agent (or the answer) chosen for the next step and returns it as a message for the history.
+        '''
         name=agent_data.get('Agent Name')
         description=agent_data.get('Agent Description')
         tasks=agent_data.get('Tasks')
@@ -46,7 +66,12 @@ class MetaAgent(BaseAgent):
             print_stmt=colored(content,color='cyan',attrs=['bold'])
         if self.verbose:
             print(print_stmt)
-        return {**state,'agent_data':agent_data,'messages':[HumanMessage(content)]}
+        return content
+
+    def expert_query(self,query:str,tasks:list[str])->str:
+        # Earlier experts' outputs are passed on only where relevant to this query and its tasks
+        information=self.task_memory.context(' '.join([query or '',*(tasks or [])]))
+        return f'Query: {query}\nInformation: {information}' if information else f'Query: {query}'
 
     def react_expert(self,state:AgentState):
         agent_data=state.get('agent_data')
@@ -55,12 +80,9 @@ class MetaAgent(BaseAgent):
         description=agent_data.get('Agent Description')
         instructions=agent_data.get('Tasks')
         # tool=agent_data.get('Tool')
-        agent=ReactAgent(name=name,description=description,instructions=instructions,tools=self.tools,llm=self.llm,verbose=self.verbose,reporter=self._reporter)
-        if self.iteration==1:
-            agent_response=agent.invoke(f'Query: {query}')
-        else:
-            previous_agent_message=state['messages'][-2] #Message before the meta agent.
-            agent_response=agent.invoke(f'Query: {query}\nInformation: {previous_agent_message.content}')
+        with agent_pool.checkout(ReactAgent,llm=self.llm,tools=self.tools,config={'verbose':self.verbose,'structured':self.structured},name=name,description=description,instructions=instructions,reporter=self._reporter) as agent:
+            agent_response=agent.invoke(self.expert_query(query,instructions))
+        self.task_memory.add(name,agent_response)
         return {**state, 'messages':[HumanMessage(f'Name: {name}\nResponse: {agent_response}')],'agent_data':None}
 
     def cot_expert(self,state:AgentState):
@@ -69,12 +91,9 @@ class MetaAgent(BaseAgent):
         query=agent_data.get('Agent Query')
         description=agent_data.get('Agent Description')
         instructions=agent_data.get('Tasks')
-        agent=COTAgent(name=name,description=description,instructions=instructions,llm=self.llm,verbose=self.verbose,reporter=self._reporter)
-        if self.iteration==1:
-            agent_response=agent.invoke(f'Query: {query}')
-        else:
-            previous_agent_message=state['messages'][-2] #Message before the meta agent.
-            agent_response=agent.invoke(f'Query: {query}\nInformation: {previous_agent_message.content}')
+        with agent_pool.checkout(COTAgent,llm=self.llm,config={'verbose':self.verbose,'structured':self.structured},name=name,description=description,instructions=instructions,reporter=self._reporter) as agent:
+            agent_response=agent.invoke(self.expert_query(query,instructions))
+        self.task_memory.add(name,agent_response)
         return {**state, 'messages':[HumanMessage(f'Name: {name}\nResponse: {agent_response}')],'agent_data':None}
 
     def final(self,state:AgentState):
@@ -84,6 +103,10 @@ class MetaAgent(BaseAgent):
             output='Iteration limit reached'
         return {**state, 'output':output}
     
+    def entry_controller(self,state:AgentState):
+        # An agent chosen ahead (e.g. by the fused plan update) skips the first meta step
+        return self.controller(state) if state.get('agent_data') else 'Meta'
+
     def controller(self,state:AgentState):
         if self.max_iteration>self.iteration:
             self.iteration+=1
@@ -104,7 +127,7 @@ class MetaAgent(BaseAgent):
         graph.add_node('COT',self.cot_expert)
         graph.add_node('Answer',self.final)
 
-        graph.set_entry_point('Meta')
+        graph.set_conditional_entry_point(self.entry_controller)
         graph.add_conditional_edges('Meta',self.controller)
         graph.add_edge('React','Meta')
         graph.add_edge('COT','Meta')
@@ -119,12 +142,23 @@ class MetaAgent(BaseAgent):
         plot=self.graph.get_graph().draw_mermaid_png(draw_method=MermaidDrawMethod.API)
         return display(Image(plot))
 
-    def invoke(self, input: str)->str:    
+    def invoke(self, input: str, agent_data: dict|None=None)->str:
+        '''
+        Solves the input with experts chosen step by step. `agent_data` is the first expert when it was already
+        chosen by the caller, in the format of the meta step, which saves one LLM call.
+        '''
         if self.verbose:
             print(f'Entering '+colored(self.name,'black','on_white'))  
+        self.task_memory=TaskMemory()
+        messages=[SystemMessage(self.system_prompt+(schema_instructions(MetaStep) if self.structured else '')),HumanMessage(f'User Query: {input}')]
+        # The experts only see what the memory retrieves, so the information given with the input goes there
+        self.task_memory.add('Input',input)
+        if agent_data:
+            messages.append(HumanMessage(self.dispatch(agent_data)))
         state={
             'input':input,
-            'messages':[SystemMessage(self.system_prompt),HumanMessage(f'User Query: {input}')],
+            'agent_data':agent_data,
+            'messages':messages,
             'output':'',
         }
         graph_response=self.graph.invoke(state)
@@ -1,17 +1,56 @@
-from src.agent.plan.utils import extract_plan,read_markdown_file,extract_llm_response
+from src.agent.plan.utils import extract_plan,extract_llm_response,extract_dispatch,PlanStep,PlanUpdate,PlanDispatch
+from src.structured import invoke_structured,schema_instructions,StructuredOutputError
 from src.message import AIMessage,HumanMessage,SystemMessage
 from langchain_core.runnables.graph import MermaidDrawMethod
 from src.agent.plan.state import PlanState,UpdateState
+from src.agent.plan.cache import get_plan_cache
 from langgraph.graph import StateGraph,END,START
 from IPython.display import display,Image
-from src.inference import BaseInference
+from src.inference import BaseInference,CallBudgetExceeded,llm_call_budget
+from src.tool.registry import get_registry
 from src.agent.meta import MetaAgent
+from src.agent.react import ReactAgent
+from src.agent.pool import agent_pool
+from src.memory import TaskMemory
 from src.router import LLMRouter
 from src.agent import BaseAgent
+from src.prompt import prompts
 from termcolor import colored
+from threading import Lock
+from os import environ
+
+class LaneStats:
+    '''
+    Process-wide count of the queries answered by each plan route, to see how much traffic takes the fast lane.
+    '''
+    def __init__(self):
+        self.lanes={}
+        self.fallbacks=0
+        self.lock=Lock()
+
+    def record(self,lane:str):
+        with self.lock:
+            self.lanes[lane]=self.lanes.get(lane,0)+1
+
+    def record_fallback(self):
+        with self.lock:
+            self.fallbacks+=1
+
+    def stats(self)->dict:
+        with self.lock:
+            total=sum(self.lanes.values())
+            direct=self.lanes.get('direct',0)
+            return {
+                'lanes':dict(self.lanes),
+                'fast_lane_share':direct/total if total else 0.0,
+                # Queries routed to the fast lane that it could not answer and went through a plan
+                'fast_lane_fallbacks':self.fallbacks,
+            }
+
+lane_stats=LaneStats()
 
 class PlanAgent(BaseAgent):
-    def __init__(self,max_iteration=10,llm:BaseInference=None,verbose=False,reporter=None,interactive_agent=None):
+    def __init__(self,max_iteration=10,llm:BaseInference=None,fast_lane:bool|None=None,fast_lane_calls:int|None=None,fused_dispatch:bool|None=None,plan_cache:bool|None=None,structured:bool=False,verbose=False,reporter=None,interactive_agent=None):
         super().__init__(reporter=reporter)
         self.name='Plan Agent'
         self.max_iteration=max_iteration
@@ -19,10 +58,74 @@ class PlanAgent(BaseAgent):
         self.verbose=verbose
         self.iteration=0
         self.llm=llm
+        # Structured mode asks for JSON following the node's schema instead of the tag format, the agents it runs inherit it
+        self.structured=structured
         self.interactive_agent=interactive_agent
+        self.task_memory=TaskMemory()
+        # Single-step queries skip planning: one ReAct agent with at most `fast_lane_calls` LLM calls
+        self.fast_lane=fast_lane if fast_lane is not None else environ.get('PLAN_FAST_LANE','true').lower() in ('1','true','yes')
+        self.fast_lane_calls=fast_lane_calls or int(environ.get('FAST_LANE_CALLS',2))
+        # The plan update also picks the agent for the next task, so the meta agent skips its first LLM call
+        self.fused_dispatch=fused_dispatch if fused_dispatch is not None else environ.get('PLAN_FUSED_DISPATCH','true').lower() in ('1','true','yes')
+        # Queries close to an earlier one reuse its plan, skipping the router and planning calls. The cache is shared by
+        # every session of the process, so it is off unless enabled
+        self.plan_cache=plan_cache if plan_cache is not None else environ.get('PLAN_CACHE','false').lower() in ('1','true','yes')
+
+    def get_system_prompt(self,key:str,schema)->str:
+        system_prompt=prompts.get(key)
+        if self.structured:
+            system_prompt+=schema_instructions(schema)
+        return system_prompt
+
+    def plan_step(self,messages,node:str='plan')->tuple[dict|None,str]:
+        if self.structured:
+            step,content=invoke_structured(self.llm,messages,PlanStep,node=node)
+            return step.to_dict(),content
+        content=self.llm.invoke(messages,node=node,validator=lambda response:bool((extract_plan(response.content) or {}).get('Plan'))).content
+        return extract_plan(content),content
+
+    def update_step(self,messages,node:str='plan_update')->dict:
+        if self.structured:
+            step,_=invoke_structured(self.llm,messages,PlanDispatch if self.fused_dispatch else PlanUpdate,node=node)
+            return step.to_dict()
+        extract=extract_dispatch if self.fused_dispatch else extract_llm_response
+        return extract(self.llm.invoke(messages,node=node).content)
     
+    def lookup(self,state:PlanState):
+        if not self.plan_cache:
+            return state
+        cached=get_plan_cache().get(state.get('input'))
+        if cached is None:
+            return state
+        _,plan=cached
+        if self.verbose:
+            self.report(plan, "tasks")
+            plan_str = '\n'.join([f'{index+1}. {task}' for index,task in enumerate(plan)])
+            print(colored(f"Cached Plan:\n{plan_str}",color='green',attrs=['bold']))
+        return {**state,'plan_type':'cached','plan':plan}
+
+    def lookup_controller(self,state:PlanState):
+        return 'execute' if state.get('plan') else 'route'
+
+    def remember(self,state:PlanState,plan:list[str]):
+        if self.plan_cache and plan:
+            get_plan_cache().put(state.get('input'),state.get('plan_type'),plan)
+
+    def execute(self,state:PlanState):
+        '''
+        Runs the plan; a cacheable plan is stored only once it produced an answer.
+        '''
+        result=self.update_graph().invoke(state)
+        if state.get('cacheable') and result.get('output'):
+            self.remember(state,state.get('plan'))
+        return result
+
     def router(self,state:PlanState):
         routes=[
+            {
+                'route': 'direct',
+                'description': 'This route answers single-step queries directly, without a plan: a fact, a definition, a quick calculation or one lookup with an existing tool (e.g. the current time, the weather, the content of a file). Use it only when one action or none is enough.'
+            },
             {
                 'route': 'simple',
                 'description': 'This route handles straightforward tasks with no user interaction. It generates a plan in one step, making it ideal for clear, uncomplicated problems that can be quickly solved.'
@@ -32,18 +135,47 @@ class PlanAgent(BaseAgent):
                 'description': 'This route is tailored for more complex, involved or ambiguous tasks that require additional information or user preferences. It involves multiple interactions to refine the plan based on specific needs, ensuring a more comprehensive and customized solution. This route is ideal for tasks that need deeper understanding or nuanced decision-making.'
             }
         ]
+        if not self.fast_lane:
+            routes=routes[1:]
         query=state.get('input')
         router=LLMRouter(routes=routes,llm=self.llm,verbose=False)
         plan_type=router.invoke(query)
         return {**state,'plan_type':plan_type}
 
+    def direct_answer(self,state:PlanState):
+        '''
+        Fast lane: one ReAct agent with the existing tools and without tool creation. Every LLM request of the agent
+        (structured output retries and cascade escalations included) counts against `fast_lane_calls`; when the
+        agent cannot answer within them the query falls back to a simple plan.
+        '''
+        query=state.get('input')
+        # The ReAct loop makes one more LLM call than its iteration limit
+        config={'verbose':self.verbose,'structured':self.structured,'max_iterations':max(self.fast_lane_calls-1,0),'tool_creation':False}
+        tools=get_registry().tools()
+        output,answered='',False
+        try:
+            with llm_call_budget(self.fast_lane_calls),agent_pool.checkout(ReactAgent,llm=self.llm,tools=tools,config=config,name='Direct Agent',description='Answers a single-step query directly, using a tool only when needed.',instructions=[query],reporter=self._reporter) as agent:
+                output=agent.invoke(query)
+                answered=agent.answered
+        except (CallBudgetExceeded,StructuredOutputError) as err:
+            if self.verbose:
+                print(colored(str(err),color='yellow'))
+        if answered:
+            return {**state,'output':output}
+        lane_stats.record_fallback()
+        if self.verbose:
+            print(colored('Fast lane could not answer, falling back to a simple plan.',color='yellow'))
+        return {**state,'plan_type':'simple','output':''}
+
+    def direct_controller(self,state:PlanState):
+        return END if state.get('output') else 'simple'
+
     def simple_plan(self,state:PlanState):
-        system_prompt=read_markdown_file('./src/agent/plan/prompt/simple_plan.md')
-        llm_response=self.llm.invoke([SystemMessage(system_prompt),HumanMessage(state.get('input'))])
-        plan_data=extract_plan(llm_response.content)
+        system_prompt=self.get_system_prompt('agent/plan/prompt/simple_plan',PlanStep)
+        plan_data,content=self.plan_step([SystemMessage(system_prompt),HumanMessage(state.get('input'))],node='simple_plan')
         
         if not plan_data:
-            print(colored(f"Error: Could not extract plan from LLM response. Response was: {llm_response.content[:200]}...", color="red"))
+            print(colored(f"Error: Could not extract plan from LLM response. Response was: {content[:200]}...", color="red"))
             # Fallback or retry logic could go here
             return {**state, 'plan': []}
             
@@ -52,24 +184,25 @@ class PlanAgent(BaseAgent):
             self.report(plan, "tasks")
             plan_str = '\n'.join([f'{index+1}. {task}' for index,task in enumerate(plan)])
             print(colored(f"Plan:\n{plan_str}",color='green',attrs=['bold']))
-        return {**state,'plan':plan}
+        return {**state,'plan':plan,'cacheable':True}
     
     def advance_plan(self,state:PlanState):
-        system_prompt=read_markdown_file('./src/agent/plan/prompt/advanced_plan.md')
+        system_prompt=self.get_system_prompt('agent/plan/prompt/advanced_plan',PlanStep)
         messages=[SystemMessage(system_prompt),HumanMessage(state.get('input'))]
-        llm_response=self.llm.invoke(messages)
-        plan_data=extract_plan(llm_response.content)
+        plan_data,content=self.plan_step(messages)
         
         if not plan_data:
             # If extraction fails, we might still have a conversational response from the LLM
             # Let's try to ask the user anyway or handle it gracefully
-            print(colored(f"Warning: Could not extract plan data. LLM says: {llm_response.content}", color="yellow"))
+            print(colored(f"Warning: Could not extract plan data. LLM says: {content}", color="yellow"))
             # For simplicity in this demo, it might be better to just return the response as a question?
             # But the loop depends on 'route'.
             return {**state, 'plan': ["Solve the user's request: " + state.get('input')]}
 
         route=plan_data.get('Route')
+        asked=False
         while route!='Plan':
+            asked=True
             question=plan_data.get('Question')
             messages.pop(-1)
             
@@ -87,12 +220,11 @@ class PlanAgent(BaseAgent):
             
             user_prompt=f'<option>\n<question>{question}</question>\n<answer>{answer}</answer>\n<route>{route}</route>\n</option>'
             messages.append(HumanMessage(user_prompt))
-            llm_response=self.llm.invoke(messages)
-            messages.append(AIMessage(llm_response.content))
-            plan_data=extract_plan(llm_response.content)
+            plan_data,content=self.plan_step(messages)
+            messages.append(AIMessage(content))
             
             if not plan_data:
-                print(colored(f"Error: Lost track of the plan format. LLM response: {llm_response.content}", color="red"))
+                print(colored(f"Error: Lost track of the plan format. LLM response: {content}", color="red"))
                 break
                 
             route=plan_data.get('Route')
@@ -102,11 +234,15 @@ class PlanAgent(BaseAgent):
             self.report(plan, "tasks")
             plan_str = '\n'.join([f'{index+1}. {task}' for index,task in enumerate(plan)])
             print(colored(f"Plan:\n{plan_str}",color='green',attrs=['bold']))
-        return {**state,'plan':plan}
+        # A plan refined by answers (or by the non-interactive default answer) belongs to this user and is not cached
+        return {**state,'plan':plan,'cacheable':not asked}
 
 
     def initialize(self,state:UpdateState):
-        system_prompt=read_markdown_file('./src/agent/plan/prompt/update.md')
+        if self.fused_dispatch:
+            system_prompt=self.get_system_prompt('agent/plan/prompt/update_dispatch',PlanDispatch)
+        else:
+            system_prompt=self.get_system_prompt('agent/plan/prompt/update',PlanUpdate)
         current=state.get('plan')[0]
         pending=state.get('plan')
         completed=[]
@@ -118,25 +254,26 @@ class PlanAgent(BaseAgent):
             print(colored(f"Pending Tasks:\n{pending_str}",color='yellow',attrs=['bold']))
             print(colored(f"Completed Tasks:\n{completed_str}",color='blue',attrs=['bold']))
         messages=[SystemMessage(system_prompt)]
-        return {**state,'messages':messages,'current':current,'pending':pending,'completed':completed,'output':''}
+        self.task_memory=TaskMemory()
+        return {**state,'messages':messages,'current':current,'pending':pending,'completed':completed,'agent_data':None,'output':''}
     
     def execute_task(self,state:UpdateState):
         plan=state.get('plan')
         current=state.get('current')
-        responses=state.get('responses')
-        agent=MetaAgent(llm=self.llm,verbose=self.verbose,reporter=self._reporter)
-        info_str = '\n'.join([f'{index+1}. {task}' for index,task in enumerate(responses)])
-        task_response=agent.invoke(f"Information:\n{info_str}\nTask:\n{current}")
+        # Only the parts of earlier task responses relevant to this task are passed on
+        info_str=self.task_memory.context(current)
+        with agent_pool.checkout(MetaAgent,llm=self.llm,config={'verbose':self.verbose,'structured':self.structured},reporter=self._reporter) as agent:
+            task_response=agent.invoke(f"Information:\n{info_str}\nTask:\n{current}",agent_data=state.get('agent_data'))
         if self.verbose:
             print(colored(f'Current Task:\n{current}',color='cyan',attrs=['bold']))
             print(colored(f'Task Response:\n{task_response}',color='cyan',attrs=['bold']))
+        self.task_memory.add(f'Task: {current}',task_response)
         user_prompt=f'Plan:\n{plan}\nTask:\n{current}\nTask Response:\n{task_response}'
         messages=[HumanMessage(user_prompt)]
-        return {**state,'messages':messages,'responses':[task_response]}
+        return {**state,'messages':messages,'responses':[task_response],'agent_data':None}
 
     def update_plan(self,state:UpdateState):
-        llm_response=self.llm.invoke(state.get('messages'))
-        plan_data=extract_llm_response(llm_response.content)
+        plan_data=self.update_step(state.get('messages'))
         plan=plan_data.get('Current Plan') or plan_data.get('Plan') or []
         pending=plan_data.get('Pending') or []
         completed=plan_data.get('Completed') or []
@@ -150,13 +287,13 @@ class PlanAgent(BaseAgent):
                 print(colored(f"Completed Tasks:\n{completed_str}",color='blue',attrs=['bold']))
         
         current = pending[0] if pending else ''
+        agent_data = plan_data.get('Next Agent') if pending else None
         
-        return {**state,'plan':plan,'current':current,'pending':pending,'completed':completed}
+        return {**state,'plan':plan,'current':current,'pending':pending,'completed':completed,'agent_data':agent_data}
     
     def final(self,state:UpdateState):
         user_prompt='All Tasks completed successfully. Now give the final answer.'
-        llm_response=self.llm.invoke(state.get('messages')+[HumanMessage(user_prompt)])
-        plan_data=extract_llm_response(llm_response.content)
+        plan_data=self.update_step(state.get('messages')+[HumanMessage(user_prompt)],node='plan_final')
         output=plan_data.get('Final Answer')
         return {**state,'output':output}
 
@@ -171,13 +308,17 @@ class PlanAgent(BaseAgent):
 
     def create_graph(self):
         graph=StateGraph(PlanState)
+        graph.add_node('lookup',self.lookup)
         graph.add_node('route',self.router)
         graph.add_node('simple',self.simple_plan)
         graph.add_node('advanced',self.advance_plan)
-        graph.add_node('execute',lambda _:self.update_graph())
+        graph.add_node('direct',self.direct_answer)
+        graph.add_node('execute',self.execute)
 
-        graph.add_edge(START,'route')
+        graph.add_edge(START,'lookup')
+        graph.add_conditional_edges('lookup',self.lookup_controller)
         graph.add_conditional_edges('route',self.route_controller)
+        graph.add_conditional_edges('direct',self.direct_controller)
         graph.add_edge('simple','execute')
         graph.add_edge('advanced','execute')
         graph.add_edge('execute',END)
@@ -210,6 +351,7 @@ class PlanAgent(BaseAgent):
             'output': ''
         }
         agent_response=self.graph.invoke(state)
+        lane_stats.record(agent_response.get('plan_type') or 'simple')
         return agent_response['output']
 
 
@@ -0,0 +1,138 @@
+from src.router.local import features
+from src.retrieval import tokenize
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from threading import Lock
+from math import sqrt
+import os
+import re
+
+WORD_PATTERN=re.compile(r'\S+')
+
+def normalize(query:str)->str:
+    return ' '.join(query.lower().split())
+
+def embed(query:str)->dict[str,float]:
+    '''
+    Unit-length bag of unigrams and bigrams of the query.
+    '''
+    counts=features(query)
+    norm=sqrt(sum(count*count for count in counts.values())) or 1.0
+    return {term:count/norm for term,count in counts.items()}
+
+def similarity(first:dict[str,float],second:dict[str,float])->float:
+    if len(first)>len(second):
+        first,second=second,first
+    return sum(value*second.get(term,0.0) for term,value in first.items())
+
+def substitutions(cached:str,query:str)->list[tuple[str,str]]|None:
+    '''
+    The spans of the cached query replaced in the new one, e.g. the keywords of the same crawl/report request.
+    None when the new query also adds or drops content words, i.e. it is not the same request with other values.
+    '''
+    old,new=WORD_PATTERN.findall(cached),WORD_PATTERN.findall(query)
+    matcher=SequenceMatcher(None,[word.lower() for word in old],[word.lower() for word in new],autojunk=False)
+    spans=[]
+    for tag,i1,i2,j1,j2 in matcher.get_opcodes():
+        if tag=='replace':
+            spans.append((' '.join(old[i1:i2]),' '.join(new[j1:j2])))
+        elif tag!='equal' and tokenize(' '.join(old[i1:i2]+new[j1:j2])):
+            return None
+    return spans
+
+def parametrize(plan:list[str],spans:list[tuple[str,str]])->list[str]|None:
+    '''
+    The plan with the replaced spans substituted, or None when a span does not appear in any task: the plan cannot
+    be adapted to the new query (e.g. "delete" for "summarize" where the tasks only say "Write a summary").
+    '''
+    for old,new in spans:
+        pattern=re.compile(r'(?<!\w)'+r'\s+'.join(map(re.escape,old.split()))+r'(?!\w)',re.IGNORECASE)
+        if not any(pattern.search(task) for task in plan):
+            return None
+        plan=[pattern.sub(lambda _:new,task) for task in plan]
+    return plan
+
+class PlanCache:
+    '''
+    Plans of earlier queries, looked up by similarity so near-identical requests (the same workflow with other
+    keywords) skip routing and planning. A hit returns the cached plan with the words that differ between the two
+    queries substituted; a query that adds or drops content words, or replaces words that do not appear in the
+    cached plan, misses whatever its similarity. Entries are evicted least recently used first.
+    '''
+    def __init__(self,max_entries:int=256,threshold:float=0.6):
+        self.max_entries=max_entries
+        self.threshold=threshold
+        # normalised query -> (query, vector, plan type, plan)
+        self.entries:OrderedDict[str,tuple[str,dict[str,float],str,list[str]]]=OrderedDict()
+        self.metrics={'hits':0,'misses':0,'stores':0,'evictions':0,'invalidations':0}
+        self.lock=Lock()
+
+    def get(self,query:str)->tuple[str,list[str]]|None:
+        '''
+        The plan type and the parametrised plan of the most similar cached query, if it clears the threshold.
+        '''
+        vector=embed(query)
+        with self.lock:
+            scores=sorted(((similarity(vector,cached_vector),key) for key,(_,cached_vector,_,_) in self.entries.items()),reverse=True)
+            for score,key in scores:
+                if score<self.threshold:
+                    break
+                cached,_,plan_type,plan=self.entries[key]
+                spans=substitutions(cached,query)
+                adapted=parametrize(plan,spans) if spans is not None else None
+                if adapted is not None:
+                    self.metrics['hits']+=1
+                    self.entries.move_to_end(key)
+                    return plan_type,adapted
+            self.metrics['misses']+=1
+            return None
+
+    def put(self,query:str,plan_type:str,plan:list[str]):
+        if not plan:
+            return
+        with self.lock:
+            self.entries[normalize(query)]=(query,embed(query),plan_type,list(plan))
+            self.entries.move_to_end(normalize(query))
+            self.metrics['stores']+=1
+            while len(self.entries)>self.max_entries:
+                self.entries.popitem(last=False)
+                self.metrics['evictions']+=1
+
+    def invalidate(self,query:str|None=None)->int:
+        '''
+        Drops the entries a query would hit (e.g. after its cached plan failed), or every entry when no query is given.
+        Returns the number of entries dropped.
+        '''
+        with self.lock:
+            if query is None:
+                keys=list(self.entries)
+            else:
+                vector=embed(query)
+                keys=[key for key,(_,cached_vector,_,_) in self.entries.items() if similarity(vector,cached_vector)>=self.threshold]
+            for key in keys:
+                self.entries.pop(key)
+            self.metrics['invalidations']+=len(keys)
+            return len(keys)
+
+    def stats(self)->dict:
+        with self.lock:
+            metrics=dict(self.metrics)
+            entries=len(self.entries)
+        lookups=metrics['hits']+metrics['misses']
+        return {**metrics,'entries':entries,'hit_rate':metrics['hits']/lookups if lookups else 0.0}
+
+plan_cache:PlanCache|None=None
+lock=Lock()
+
+def get_plan_cache()->PlanCache:
+    '''
+    The plan cache shared by the plan agents, configured from the environment on first use.
+    '''
+    global plan_cache
+    with lock:
+        if plan_cache is None:
+            plan_cache=PlanCache(
+                max_entries=int(os.environ.get('PLAN_CACHE_SIZE',256)),
+                threshold=float(os.environ.get('PLAN_CACHE_THRESHOLD',0.6)),
+            )
+        return plan_cache
@@ -10,6 +10,8 @@ class PlanState(TypedDict):
     plan_type: str
     plan_status: str
     plan: list[str]
+    # The plan can be reused for other users: it was not shaped by their answers to clarifying questions
+    cacheable: bool
     output: str
 
 class UpdateState(TypedDict):
@@ -18,5 +20,6 @@ class UpdateState(TypedDict):
     responses:Annotated[list[str],add]
     pending: list[str]
     completed: list[str]
+    agent_data: dict|None
     output:str
     messages: Annotated[list[BaseMessage],add]
\ No newline at end of file
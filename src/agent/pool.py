@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from threading import Lock
+
+class AgentPool:
+    '''
+    Keeps idle agent instances keyed by their class, llm, tool set and configuration.
+    A checkout reuses an idle instance (already compiled graph, serialised tools and loaded prompt)
+    and calls its `reset` with the per-invocation parameters; the instance goes back to the pool afterwards.
+    '''
+    def __init__(self,max_idle:int=8):
+        self.max_idle=max_idle
+        self.idle:dict[tuple,list]={}
+        self.lock=Lock()
+        self.created=0
+        self.reused=0
+
+    def key(self,agent_cls,llm=None,tools:list=[],**config)->tuple:
+        return (agent_cls,id(llm),tuple(tool.name for tool in tools),tuple(sorted(config.items())))
+
+    @contextmanager
+    def checkout(self,agent_cls,llm=None,tools:list|None=None,config:dict={},**params):
+        key=self.key(agent_cls,llm,tools or [],**config)
+        with self.lock:
+            bucket=self.idle.get(key)
+            agent=bucket.pop() if bucket else None
+            if agent is None:
+                self.created+=1
+            else:
+                self.reused+=1
+        if agent is None:
+            kwargs={'llm':llm,**config}
+            if tools is not None:
+                kwargs['tools']=tools
+            agent=agent_cls(**kwargs)
+        agent.reset(**params)
+        try:
+            yield agent
+        finally:
+            agent.reset()
+            with self.lock:
+                bucket=self.idle.setdefault(key,[])
+                if len(bucket)<self.max_idle:
+                    bucket.append(agent)
+
+    def stats(self)->dict:
+        with self.lock:
+            return {
+                'created':self.created,
+                'reused':self.reused,
+                'idle':sum(len(bucket) for bucket in self.idle.values())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.idle.clear()
+
+agent_pool=AgentPool()
@@ -1,52 +1,147 @@
-from src.agent.react.utils import extract_llm_response,read_markdown_file
+from src.agent.react.utils import extract_llm_response,ReactStep
+from src.structured import invoke_structured,schema_instructions
+from src.parser import TagParser
+from src.memory import WindowMemory,estimate_tokens
 from src.message import AIMessage,HumanMessage,SystemMessage
 from langchain_core.runnables.graph import MermaidDrawMethod
-from src.tool.prebuilt import user_interface_tool
+from src.tool.prebuilt import user_interface_tool,artifact_reader_tool
+from src.tool.artifact import ArtifactStore
+from src.inference.tokens import get_token_counter
 from src.agent.react.state import AgentState
-from importlib import reload,import_module
 from IPython.display import display,Image
 from src.inference import BaseInference
 from langgraph.graph import StateGraph
 from src.agent.tool import ToolAgent
+from src.retrieval import BM25Index
+from src.tool.registry import get_registry
+from src.tool.sandbox import get_sandbox
+from src.tool.cache import tool_cache
+from src.tool.runtime import tool_runtime
 from src.agent import BaseAgent
+from src.prompt import prompts
 from termcolor import colored
 from platform import system
 from getpass import getuser
 from time import sleep
-from os import getcwd
+from os import getcwd,environ
+from time import perf_counter
+import asyncio
 import json
 
 class ReactAgent(BaseAgent):
-    def __init__(self,name:str='',description:str='',instructions:list[str]=[],tools:list=[],llm:BaseInference=None,max_iterations=10,dynamic_tools_file:str='experimental.py',json=False,verbose=False,reporter=None):
+    # The model is stopped before it hallucinates an observation or pads the option
+    stop_sequences=['<Observation','</Option>']
+
+    def __init__(self,name:str='',description:str='',instructions:list[str]=[],tools:list=[],llm:BaseInference=None,max_iterations=10,cooldown:float|None=None,tool_creation:bool=True,dynamic_tools_file:str='experimental.py',sandbox:bool=True,tool_top_k:int|None=None,memory:WindowMemory|None=None,structured:bool=False,json=False,verbose=False,reporter=None):
         super().__init__(reporter=reporter)
         self.name=name
         self.description=description
         self.instructions=self.get_instructions(instructions)
-        self.system_prompt=read_markdown_file('./src/agent/react/prompt.md')
+        self.system_prompt=prompts.get('agent/react/prompt')
+        self.context_prompt=prompts.get('agent/react/context')
         self.max_iterations=max_iterations
+        # Pause before every second LLM call to stay under provider rate limits (0 disables it)
+        self.cooldown=cooldown if cooldown is not None else float(environ.get('LLM_COOLDOWN',0))
+        # Without tool creation a request for a new tool ends the run unanswered instead of calling the Tool Agent
+        self.tool_creation=tool_creation
+        # Whether the last run ended with a final answer
+        self.answered=False
         self.tool_names=[]
         self.tools_description=[]
         self.tools={}
         self.iteration=0
         self.dynamic_tools_file=dynamic_tools_file
-        self.dynamic_tools_module=import_module(dynamic_tools_file.split('.')[0])
+        self.tool_registry=get_registry(dynamic_tools_file)
+        self.sandbox=sandbox
+        # Large observations are spilled to a per-run artifact store, created on first use
+        self.artifacts=None
+        # Optionally older steps are folded into a summary so the prompt does not grow with every iteration (full history by default)
+        self.memory=memory or WindowMemory(window=int(environ.get('REACT_MEMORY_WINDOW',0)) or None,max_tokens=int(environ.get('REACT_MEMORY_TOKENS',0)) or None)
+        # Structured mode asks for JSON following ReactStep instead of the tag format
+        self.structured=structured
+        # Only the top-k tools relevant to the query are shown in the prompt (None shows the full catalog)
+        self.tool_top_k=tool_top_k if tool_top_k is not None else int(environ.get('TOOL_TOP_K',0)) or None
+        self.metrics={'catalog_tokens':0,'prompt_tokens':0,'tools_selected':0,'llm_latency':[],'early_stops':0,'step_prompt_tokens':[],'step_history_tokens':[]}
         self.llm=llm
         self.verbose=verbose
         self.graph=self.create_graph()
-        self.add_tools_to_toolbox([user_interface_tool,*tools])
+        # Built-in tools come first and are always shown in the prompt
+        self.builtin_tools=[user_interface_tool,artifact_reader_tool]
+        self.add_tools_to_toolbox([*self.builtin_tools,*tools])
+        self.toolbox=(list(self.tool_names),list(self.tools_description),dict(self.tools))
+
+    def reset(self,name:str='',description:str='',instructions:list[str]=[],reporter=None):
+        super().reset(reporter=reporter)
+        self.name=name
+        self.description=description
+        self.instructions=self.get_instructions(instructions)
+        self.iteration=0
+        self.close_artifacts()
+        self.metrics={'catalog_tokens':0,'prompt_tokens':0,'tools_selected':0,'llm_latency':[],'early_stops':0,'step_prompt_tokens':[],'step_history_tokens':[]}
+        tool_names,tools_description,tools=self.toolbox
+        self.tool_names=list(tool_names)
+        self.tools_description=list(tools_description)
+        self.tools=dict(tools)
+
+    def close_artifacts(self):
+        if self.artifacts is not None:
+            self.artifacts.close()
+            self.artifacts=None
 
     def reason(self,state:AgentState):
-        if self.iteration%2!=0:
-            sleep(60) #To prevent from hitting the API rate limit
-        message=self.llm.invoke(state['messages'])
-        response=extract_llm_response(message.content)
+        if self.cooldown and self.iteration%2!=0:
+            sleep(self.cooldown)
+        messages=self.memory.view(state['messages'])
+        self.metrics['step_prompt_tokens'].append(estimate_tokens(messages))
+        self.metrics['step_history_tokens'].append(estimate_tokens(state['messages']))
+        start=perf_counter()
+        if self.structured:
+            step,content=invoke_structured(self.llm,messages,ReactStep,node='react')
+            message=AIMessage(content)
+            response=step.to_dict()
+        else:
+            parser=self.generate(messages)
+            message=AIMessage(parser.buffer)
+            response=extract_llm_response(parser)
+        self.metrics['llm_latency'].append(perf_counter()-start)
         # print(message.content)
         thought=response.get('Thought')
         if self.verbose:
             self.report(thought, "thought")
             print(colored(f'Thought: {thought}',color='green',attrs=['bold']))
+            if len(messages)<len(state['messages']):
+                print(colored(f"Prompt: ~{self.metrics['step_prompt_tokens'][-1]} tokens (full history ~{self.metrics['step_history_tokens'][-1]} tokens)",color='grey',attrs=['bold']))
         return {**state,'messages':[message]}
 
+    def generate(self,messages)->TagParser:
+        '''
+        Streams the response into the tag parser and stops the generation as soon as the step is decided,
+        so the tools can be dispatched without waiting for the tail of the response.
+        '''
+        parser=TagParser()
+        chunks=self.llm.stream(messages,stop=self.stop_sequences,node='react')
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                observation=parser.find('observation',closed=False)
+                if observation is not None:
+                    # Drop the observation the model started to make up
+                    parser.buffer=parser.buffer[:parser.buffer.rfind('<',0,observation.start)]
+                    break
+                if parser.find('option') or (parser.find('route') and parser.find('action-input')):
+                    break
+            else:
+                return parser
+        finally:
+            chunks.close()
+        self.metrics['early_stops']+=1
+        return parser
+
+    def parse(self,content:str)->dict:
+        if self.structured:
+            return ReactStep.model_validate_json(content).to_dict()
+        return extract_llm_response(content)
+
     def get_instructions(self,instructions):
         return '\n'.join([f'{i+1}. {instruction}' for i,instruction in enumerate(instructions)])
 
@@ -81,36 +176,67 @@ class ReactAgent(BaseAgent):
 
     def action(self,state:AgentState):
         message=(state['messages'][-1])
-        response=extract_llm_response(message.content)
+        response=self.parse(message.content)
         thought=response.get('Thought')
-        action_name=response.get('Action Name')
-        action_input=response.get('Action Input')
         route=response.get('Route')
+        actions=response.get('Actions') or [{'Action Name':response.get('Action Name'),'Action Input':response.get('Action Input')}]
         if self.verbose:
-            self.report(action_name, "tool")
-            self.report(action_input, "action_input")
-            print(colored(f'Action Name: {action_name}',color='cyan',attrs=['bold']))
-            print(colored(f'Action Input: {json.dumps(action_input,indent=2)}',color='cyan',attrs=['bold']))
-        if action_name not in self.tool_names:
-            observation="This tool is not available in the tool box."
-        else:
-            tool=self.tools[action_name]
-            try:
-                observation=tool(**action_input)
-            except Exception as e:
-                observation=str(e)
+            for action in actions:
+                self.report(action['Action Name'], "tool")
+                self.report(action['Action Input'], "action_input")
+                print(colored(f"Action Name: {action['Action Name']}",color='cyan',attrs=['bold']))
+                print(colored(f"Action Input: {json.dumps(action['Action Input'],indent=2)}",color='cyan',attrs=['bold']))
+        # Independent actions of the same step run concurrently on the shared tool loop and are answered in one message
+        observations=tool_runtime.run(self.run_actions(actions))
+        # Keep oversized outputs out of the prompt and the UI: a preview and a handle for the Artifact Reader Tool
+        if self.artifacts is None:
+            self.artifacts=ArtifactStore()
+        # The reader's pages are already sized for the prompt, spilling them again would hide the page it just read
+        observations=[observation if action['Action Name']==artifact_reader_tool.name else self.artifacts.spill(action['Action Name'],observation) for action,observation in zip(actions,observations)]
         if self.verbose:
-            self.report(observation, "observation")
-            print(colored(f'Observation: {observation}',color='magenta',attrs=['bold']))
+            for observation in observations:
+                self.report(observation, "observation")
+                print(colored(f'Observation: {observation}',color='magenta',attrs=['bold']))
         state['messages'].pop()
-        messages=[
-            AIMessage(f'<Thought>{thought}</Thought>\n<Action Name>{action_name}</Action Name>\n<Action Input>{json.dumps(action_input,indent=2)}</Action Input>\n<Route>{route}</Route>'),
-            HumanMessage(f'<Observation>{observation}</Observation>')]
+        actions_str='\n'.join(f"<Action Name>{action['Action Name']}</Action Name>\n<Action Input>{json.dumps(action['Action Input'],indent=2)}</Action Input>" for action in actions)
+        if len(actions)==1:
+            observations_str=f'<Observation>{observations[0]}</Observation>'
+        else:
+            observations_str='\n'.join(f"<Observation tool=\"{action['Action Name']}\">{observation}</Observation>" for action,observation in zip(actions,observations))
+        if self.structured:
+            ai_message=AIMessage(message.content)
+        else:
+            ai_message=AIMessage(f'<Thought>{thought}</Thought>\n{actions_str}\n<Route>{route}</Route>')
+        messages=[ai_message,HumanMessage(observations_str)]
         return {**state,'messages':messages}
 
+    async def run_actions(self,actions:list[dict])->list:
+        # Concurrency of sync tools is bounded by the runtime's thread pool and of generated tools by the sandbox pool
+        return await asyncio.gather(*(self.run_action(action) for action in actions))
+
+    async def run_action(self,action:dict):
+        action_name=action.get('Action Name')
+        action_input=action.get('Action Input')
+        if action_name not in self.tool_names:
+            return "This tool is not available in the tool box."
+        tool=self.tools[action_name]
+        try:
+            return await tool_cache.acall(tool,action_input,lambda:self.execute_tool(tool,action_input))
+        except Exception as e:
+            return str(e)
+
+    async def execute_tool(self,tool,action_input:dict):
+        # Generated tools run in the sandbox pool, built-in tools (e.g. user interaction) stay in-process
+        sandbox=get_sandbox() if self.sandbox and hasattr(tool,'unit') else None
+        if sandbox:
+            return await sandbox.acall(tool,action_input)
+        if getattr(tool,'is_async',False):
+            return await tool(**action_input)
+        return await tool_runtime.offload(lambda:tool(**action_input))
+
     def tool_agent(self,state:AgentState):
         message=(state['messages'][-1])
-        response=extract_llm_response(message.content)
+        response=self.parse(message.content)
         query=response.get('Query')
         generator=ToolAgent(location=self.dynamic_tools_file,llm=self.llm,verbose=self.verbose,json=True)
         tool_info=generator.invoke(query)
@@ -118,14 +244,16 @@ class ReactAgent(BaseAgent):
         func_name=tool_info.get('func_name')
         output=tool_info.get('output')
         route=tool_info.get('route')
-        reload(self.dynamic_tools_module)
+        if tool_name:
+            tool_cache.invalidate(tool_name)
         if route=='delete':
+            self.tool_registry.unload(tool_name)
             self.remove_tool_from_toolbox(tool_name)
             content=f'{output} Now the tool is removed from the tool box.'        
         else:
             tool = None
             try:
-                tool=getattr(self.dynamic_tools_module,func_name)
+                tool=self.tool_registry.load(func_name)
             except Exception as e:
                 print(f'Error loading tool {func_name}: {e}')
                 content=f'Error: Could not load tool "{func_name}". {str(e)}'
@@ -144,12 +272,16 @@ class ReactAgent(BaseAgent):
         return {**state,'messages':[HumanMessage(content)]}
 
     def final(self,state:AgentState):
-        if self.max_iterations>self.iteration:
-            message=state['messages'][-1]
-            response=extract_llm_response(message.content)
-            final_answer=response.get('Final Answer')
-        else:
-            final_answer="The maximum number of iterations has been reached."
+        message=state['messages'][-1]
+        response=self.parse(message.content) if isinstance(message,AIMessage) else None
+        # The last allowed step may still be the answer
+        final_answer=response.get('Final Answer') if response else None
+        self.answered=final_answer is not None
+        if final_answer is None:
+            if self.max_iterations<=self.iteration:
+                final_answer="The maximum number of iterations has been reached."
+            elif response and (response.get('Route') or '').lower()=='tool':
+                final_answer="A new tool is needed to answer this query."
         if self.verbose:
             print(colored(f'Answer: {final_answer}',color='blue',attrs=['bold']))
         return {**state,'output':final_answer}
@@ -158,8 +290,10 @@ class ReactAgent(BaseAgent):
         if self.max_iterations>self.iteration:
             self.iteration+=1
             message=(state['messages'][-1])
-            response=extract_llm_response(message.content)
+            response=self.parse(message.content)
             route = response.get('Route') if response else None
+            if route and route.lower()=='tool' and not self.tool_creation:
+                return 'final'
             if route:
                 return route.lower()
             else:
@@ -191,22 +325,58 @@ class ReactAgent(BaseAgent):
         plot=self.graph.get_graph().draw_mermaid_png(draw_method=MermaidDrawMethod.API)
         return display(Image(plot))
 
-    def invoke(self,input:str)->str:
-        if self.verbose:
-            print(f'Entering '+colored(self.name,'black','on_white'))
-        tools_str = ',\n'.join(self.tools_description)
+    def select_tools(self,input:str)->list[int]:
+        '''
+        Indices of the tools to show in the prompt: the built-in tools plus the top-k tools
+        whose name and description best match the query, description and instructions.
+        '''
+        indices=list(range(len(self.tool_names)))
+        pinned=len(self.builtin_tools)
+        if not self.tool_top_k or len(indices)<=self.tool_top_k+pinned:
+            return indices
+        index=BM25Index()
+        for i in indices[pinned:]:
+            tool=self.tools[self.tool_names[i]]
+            index.add(i,f'{tool.name} {tool.description or ""}')
+        hits=index.search(f'{input} {self.description} {self.instructions}',k=self.tool_top_k)
+        return [*indices[:pinned],*sorted(i for i,_ in hits)]
+
+    def get_system_messages(self,input:str)->list[SystemMessage]:
+        '''
+        The static system prompt (identical for every ReAct agent, so the backend can cache it) followed by
+        the agent context with its name, description, instructions and the selected tools.
+        '''
+        selected=self.select_tools(input)
+        tools_str = ',\n'.join(self.tools_description[i] for i in selected)
         parameters={
             'name':self.name,
             'description':self.description,
             'instructions':self.instructions,
             'tools':f'[{tools_str}]',
-            'tool_names':self.tool_names
+            'tool_names':[self.tool_names[i] for i in selected]
         }
-        system_prompt=self.system_prompt.format(**parameters)
+        system_prompt=self.system_prompt
+        if self.structured:
+            system_prompt+=schema_instructions(ReactStep)
+        context=self.context_prompt.format(**parameters)
+        counter=get_token_counter()
+        catalog_tokens=sum(counter.count(description) for description in self.tools_description)
+        self.metrics['prompt_tokens']=counter.count(system_prompt)+counter.count(context)
+        self.metrics['catalog_tokens']=self.metrics['prompt_tokens']-counter.count(tools_str)+catalog_tokens
+        self.metrics['tools_selected']=len(selected)
+        if self.verbose and self.tool_top_k:
+            print(colored(f"Tools: {len(selected)}/{len(self.tool_names)} selected, system prompt ~{self.metrics['prompt_tokens']} tokens (full catalog ~{self.metrics['catalog_tokens']} tokens)",color='grey',attrs=['bold']))
+        return [SystemMessage(system_prompt),SystemMessage(context)]
+
+    def invoke(self,input:str)->str:
+        if self.verbose:
+            print(f'Entering '+colored(self.name,'black','on_white'))
+        self.close_artifacts()
+        system_messages=self.get_system_messages(input)
         user_prompt=f"Question:{input}\nNote: Use the following information wisely.\nOperating System: {system()}\nUser: {getuser()}\nCWD: {getcwd()}\n"
         state={
             'input':input,
-            'messages':[SystemMessage(system_prompt),HumanMessage(user_prompt)],
+            'messages':[*system_messages,HumanMessage(user_prompt)],
             'output':'',
         }
         response=self.graph.invoke(state)
@@ -215,19 +385,12 @@ class ReactAgent(BaseAgent):
     def stream(self, input: str):
         if self.verbose:
             print(f'Entering {self.name}')
-        tools_str = ',\n'.join(self.tools_description)
-        parameters={
-            'name':self.name,
-            'description':self.description,
-            'instructions':self.instructions,
-            'tools':f'[{tools_str}]',
-            'tool_names':self.tool_names
-        }
-        system_prompt=self.system_prompt.format(**parameters)
+        self.close_artifacts()
+        system_messages=self.get_system_messages(input)
         user_prompt=f"Question:{input}\n Operating System:{system()}\nUser:{getuser()}\nCWD:{getcwd()}"
         state={
             'input':input,
-            'messages':[SystemMessage(system_prompt),HumanMessage(user_prompt)],
+            'messages':[*system_messages,HumanMessage(user_prompt)],
             'output':'',
         }
         events=self.graph.stream(state)
@@ -1,66 +1,66 @@
-import re
+from pydantic import BaseModel,Field
+from src.parser import TagParser,parse_tags
+from typing import Literal,Optional
+import json
 import ast
 
-def extract_llm_response(response: str) -> dict:
-    # Initialize variables to store extracted information
+def parse_action_input(action_input_str: str):
+    try:
+        return ast.literal_eval(action_input_str)
+    except (ValueError, SyntaxError):
+        pass
+    try:
+        return json.loads(action_input_str)  # JSON literals such as true/null
+    except ValueError:
+        return action_input_str  # If parsing fails, keep it as a string
+
+def extract_llm_response(response: str|TagParser) -> dict:
+    # Accepts the raw response or a parser that was already fed with it (e.g. while streaming)
+    parser = response if isinstance(response, TagParser) else parse_tags(response)
     result = {
-        'Thought': None,
+        'Thought': parser.text('Thought'),
         'Action Name': None,
         'Action Input': None,
-        'Query': None,
-        'Final Answer': None,
-        'Route': None
+        'Actions': [],
+        'Query': parser.text('Query'),
+        'Final Answer': parser.text('Final Answer'),
+        'Route': parser.text('Route')
     }
-    
-    # Clean response from code blocks if present
-    clean_response = re.sub(r'```[a-zA-Z]*\n?', '', response)
-    clean_response = re.sub(r'```', '', clean_response)
-
-    # Define regular expressions for different parts of the response - more flexible and case-insensitive
-    thought_regex = re.compile(r'<Thought>\s*(.*?)\s*</Thought>', re.DOTALL | re.IGNORECASE)
-    action_name_regex = re.compile(r'<Action\s*Name>\s*(.*?)\s*</Action\s*Name>', re.DOTALL | re.IGNORECASE)
-    action_input_regex = re.compile(r'<Action\s*Input>\s*(\{.*?\})\s*</Action\s*Input>', re.DOTALL | re.IGNORECASE)
-    query_regex = re.compile(r'<Query>\s*(.*?)\s*</Query>', re.DOTALL | re.IGNORECASE)
-    final_answer_regex = re.compile(r'<Final\s*Answer>\s*(.*?)\s*</Final\s*Answer>', re.DOTALL | re.IGNORECASE)
-    route_regex = re.compile(r'<Route>\s*(.*?)\s*</Route>', re.DOTALL | re.IGNORECASE)
-
-    # Extract Thought
-    thought_match = thought_regex.search(clean_response)
-    if thought_match:
-        result['Thought'] = thought_match.group(1).strip()
-
-    # Extract Action Name
-    action_name_match = action_name_regex.search(clean_response)
-    if action_name_match:
-        result['Action Name'] = action_name_match.group(1).strip()
 
-    # Extract Action Input
-    action_input_match = action_input_regex.search(response)
-    if action_input_match:
-        action_input_str = action_input_match.group(1).strip()
-        try:
-            result['Action Input'] = ast.literal_eval(action_input_str)
-        except (ValueError, SyntaxError):
-            result['Action Input'] = action_input_str  # If parsing fails, keep it as a string
+    # Collect every Action Name/Action Input pair, in order, for steps that call several tools at once
+    for action_name, action_input in zip(parser.texts('Action Name'), parser.texts('Action Input')):
+        result['Actions'].append({'Action Name': action_name, 'Action Input': parse_action_input(action_input)})
+    if result['Actions']:
+        result['Action Name'] = result['Actions'][0]['Action Name']
+        result['Action Input'] = result['Actions'][0]['Action Input']
+        # The generation may be stopped before the route once the actions are complete
+        if not result['Route']:
+            result['Route'] = 'Action'
 
-    # Extract Query
-    query_match = query_regex.search(response)
-    if query_match:
-        result['Query'] = query_match.group(1).strip()
-
-    # Extract Final Answer
-    final_answer_match = final_answer_regex.search(response)
-    if final_answer_match:
-        result['Final Answer'] = final_answer_match.group(1).strip()
+    return result
 
-    # Extract Route
-    route_match = route_regex.search(response)
-    if route_match:
-        result['Route'] = route_match.group(1).strip()
+class ReactAction(BaseModel):
+    name: str = Field(..., description='The name of the tool selected from the tool box.')
+    input: str = Field('{}', description='The tool arguments as a JSON object encoded in a string.')
 
-    return result
+class ReactStep(BaseModel):
+    '''
+    Schema of one ReAct step for the structured output mode.
+    '''
+    thought: str = Field(..., description='Your reasoning for this step.')
+    actions: list[ReactAction] = Field(default_factory=list, description='Tool calls for the Action route; several only if they are independent.')
+    query: Optional[str] = Field(None, description='The request for the Tool Agent for the Tool route.')
+    final_answer: Optional[str] = Field(None, description='The final answer in markdown for the Final route.')
+    route: Literal['Action', 'Tool', 'Final']
 
-def read_markdown_file(file_path: str) -> str:
-    with open(file_path, 'r',encoding='utf-8') as f:
-        markdown_content = f.read()
-    return markdown_content
\ No newline at end of file
+    def to_dict(self) -> dict:
+        actions = [{'Action Name': action.name, 'Action Input': parse_action_input(action.input)} for action in self.actions]
+        return {
+            'Thought': self.thought,
+            'Action Name': actions[0]['Action Name'] if actions else None,
+            'Action Input': actions[0]['Action Input'] if actions else None,
+            'Actions': actions,
+            'Query': self.query,
+            'Final Answer': self.final_answer,
+            'Route': self.route
+        }
@@ -1,15 +1,16 @@
-from src.agent.tool.utils import (extract_tools_from_module,
-update_tool_to_module,save_tool_to_module,remove_tool_from_module,
-read_markdown_file)
+from src.agent.tool.utils import (find_tool_in_module,
+update_tool_to_module,save_tool_to_module,remove_tool_from_module)
 from langchain_core.runnables.graph import MermaidDrawMethod
 from src.message import HumanMessage,SystemMessage
 from src.agent.tool.state import AgentState
+from src.tool.registry import get_registry
+from src.tool.store import get_store
 from langgraph.graph import StateGraph,END
-from importlib import import_module,reload
 from IPython.display import display,Image
 from src.inference import BaseInference
 from src.router import LLMRouter
 from src.agent import BaseAgent
+from src.prompt import prompts
 from termcolor import colored
 from subprocess import run
 import ast
@@ -30,13 +31,15 @@ class ToolAgent(BaseAgent):
             with open(self.location,'w',encoding='utf-8') as f:
                 f.write(content)
             print(f'{self.location} has been created successfully.')
+        # Drop shadowed duplicate definitions left by earlier runs without blocking the agent
+        get_store(self.location).compact_async()
 
     def generate_tool(self,state:AgentState):
-        system_prompt=read_markdown_file('./src/agent/tool/prompt/generate.md')
+        system_prompt=prompts.get('agent/tool/prompt/generate')
         user_prompt='**Query:**\n`{query}`'
         system_message=SystemMessage(system_prompt)
         human_message=HumanMessage(user_prompt.format(query=state.get('input')))
-        tool_data=self.llm.invoke([system_message,human_message],json=True)
+        tool_data=self.llm.invoke([system_message,human_message],json=True,node='tool_generate')
         try:
             ast.parse(tool_data.content.get('tool'))
             error=''
@@ -50,11 +53,11 @@ class ToolAgent(BaseAgent):
 
     def update_tool(self,state:AgentState):
         tool=self.find_the_tool(state.get('input'))
-        system_prompt=read_markdown_file('./src/agent/tool/prompt/update.md')
+        system_prompt=prompts.get('agent/tool/prompt/update')
         user_prompt='Use the following inputs to guide the tool update:\n\n**Tool Definition (Existing):**\n`{tool_definition}`\n**Query (Modification Required):**\n`{query}`'
         human_message=HumanMessage(user_prompt.format(tool_definition=tool.get('tool'),query=state.get('input')))
         system_message=SystemMessage(system_prompt)
-        updated_tool_data=self.llm.invoke([system_message,human_message],json=True)
+        updated_tool_data=self.llm.invoke([system_message,human_message],json=True,node='tool_update')
         try:
             ast.parse(updated_tool_data.content.get('tool'))
             error=''
@@ -91,13 +94,13 @@ class ToolAgent(BaseAgent):
         
         iteration=0
         max_iteration=5
-        system_prompt=read_markdown_file('./src/agent/tool/prompt/debug.md')
+        system_prompt=prompts.get('agent/tool/prompt/debug')
         system_message=SystemMessage(system_prompt)
         user_prompt='Use the following inputs to guide the tool debugging:\n\n**Tool Definition:**\n`{tool_definition}`\n**Error Message:**\n`{error_message}`'
         human_message=HumanMessage(user_prompt.format(tool_definition=tool_data.get('tool'),error_message=error))
         messages=[system_message,human_message]
         while error and iteration<max_iteration:
-            debug_tool_data=self.llm.invoke(messages,json=True)
+            debug_tool_data=self.llm.invoke(messages,json=True,node='tool_debug')
             # print(debug_tool_data.content)
             try:
                 ast.parse(debug_tool_data.content.get('tool'))
@@ -128,8 +131,7 @@ class ToolAgent(BaseAgent):
     
     def reloader(self,state:AgentState):
         route=state.get('route').lower()
-        module=import_module(self.location.split('.')[0])
-        reload(module)
+        registry=get_registry(self.location)
         tool_data = state.get('tool_data') or {}
         if isinstance(tool_data, str):
             try:
@@ -161,12 +163,9 @@ class ToolAgent(BaseAgent):
             func_name = re.sub(r'[^a-z0-9_]', '', func_name)
         
         try:
-            tool = getattr(module, func_name)
+            tool = registry.load(func_name)
         except AttributeError as e:
-            # If still can't find, try to list all functions in module and match
-            import inspect
-            all_funcs = [name for name, obj in inspect.getmembers(module) if inspect.isfunction(obj)]
-            print(f"Error: Function '{func_name}' not found in module. Available functions: {all_funcs}")
+            print(f"Error: {e}")
             raise
         
         tool_name = tool_data.get('name', func_name)
@@ -182,17 +181,11 @@ class ToolAgent(BaseAgent):
         return {**state,"output":output}
 
     def find_the_tool(self,query:str):
-        tools=extract_tools_from_module(self.location)
-        specific_tool=None
-        for tool in tools:
-            if tool.get('tool_name') in query:
-                specific_tool=tool
-                break
-        return specific_tool
+        return find_tool_in_module(self.location,query)
     
     def package_installer(self,state:AgentState):
-        system_prompt=read_markdown_file('./src/agent/tool/prompt/package_installer.md')
-        llm_response=self.llm.invoke([SystemMessage(system_prompt.format(query=state.get('input')))],json=True)
+        system_prompt=prompts.get('agent/tool/prompt/package_installer')
+        llm_response=self.llm.invoke([SystemMessage(system_prompt.format(query=state.get('input')))],json=True,node='tool_install')
         cmd=llm_response.content.get('command')
         process=run(cmd.split(' '),text=True,capture_output=True)
         if process.returncode!=0:
@@ -1,16 +1,109 @@
+from src.inference.tokens import TokenCounter,get_token_counter,fit_messages
+from src.inference.profile import GenerationProfile,default_profiles
+from src.message import AIMessage,BaseMessage,HumanMessage
+from contextlib import contextmanager
+from contextvars import ContextVar
 from abc import ABC,abstractmethod
-from src.message import AIMessage
+from threading import Lock
+
+class CallBudgetExceeded(Exception):
+    pass
+
+class CallBudget:
+    '''
+    Cap on the LLM requests made while it is active, counted where every backend request goes through (`prepare`),
+    so retries, cascade escalations and samples count as well.
+    '''
+    def __init__(self,max_calls:int):
+        self.max_calls=max_calls
+        self.calls=0
+        self.lock=Lock()
+
+    def charge(self,node:str|None=None):
+        with self.lock:
+            if self.calls>=self.max_calls:
+                raise CallBudgetExceeded(f'LLM call budget of {self.max_calls} calls exhausted ({node or "default"} node).')
+            self.calls+=1
+
+call_budget:ContextVar[CallBudget|None]=ContextVar('call_budget',default=None)
+
+@contextmanager
+def llm_call_budget(max_calls:int):
+    '''
+    Limits the LLM requests made in this context (and in the threads it copies its context to) to `max_calls`.
+    '''
+    budget=CallBudget(max_calls)
+    token=call_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        call_budget.reset(token)
 
 class BaseInference(ABC):
-    def __init__(self,model:str='',api_key:str='',base_url:str='',temperature:float=0.5):
+    def __init__(self,model:str='',api_key:str='',base_url:str='',temperature:float=0.5,max_tokens:int|None=None,token_counter:TokenCounter|None=None,profiles:dict[str,GenerationProfile]|None=None):
         self.model=model
         self.api_key=api_key
         self.base_url=base_url
         self.temperature=temperature
+        self.max_tokens=max_tokens
         self.headers={'Content-Type': 'application/json'}
+        self.token_counter=token_counter or get_token_counter()
+        # Generation profiles by node name, "default" applies to every node
+        self.profiles={**default_profiles(),**(profiles or {})}
+        self.token_usage={}
+        self.token_lock=Lock()
     @abstractmethod
     def invoke(self,messages:list[dict])->AIMessage:
         pass
 
+    def stream(self,messages:list[dict],json:bool=False,stop:list[str]|None=None,node:str|None=None):
+        '''
+        Yields the response in chunks. Backends without streaming yield the whole response at once.
+        Closing the generator early aborts the generation.
+        '''
+        yield self.invoke(messages,json=json,stop=stop,node=node).content
+
+    def get_profile(self,node:str|None=None,json:bool=False,stop:list[str]|None=None)->GenerationProfile:
+        '''
+        Settings for a call from the node: its profile over the default profile over the backend settings.
+        The stop sequences of the caller and of the profile are combined, JSON mode is on if either asks for it.
+        '''
+        backend=GenerationProfile(model=self.model,temperature=self.temperature,max_tokens=self.max_tokens)
+        profile=backend.merge(self.profiles.get('default')).merge(self.profiles.get(node))
+        stop=list(dict.fromkeys([*(stop or []),*(profile.stop or [])]))
+        return profile.model_copy(update={'stop':stop or None,'json_mode':bool(json or profile.json_mode)})
+
+    def prepare(self,messages:str|list[BaseMessage],node:str|None=None,json:bool=False,stop:list[str]|None=None)->tuple[list[BaseMessage],GenerationProfile]:
+        '''
+        Resolves the generation profile of the node, counts the prompt and fits it in the input budget of the profile.
+        Every chat backend calls it before sending a request.
+        '''
+        budget=call_budget.get()
+        if budget is not None:
+            budget.charge(node)
+        if isinstance(messages,str):
+            messages=[HumanMessage(messages)]
+        profile=self.get_profile(node,json=json,stop=stop)
+        if profile.max_input_tokens:
+            fitted,tokens=fit_messages(messages,profile.max_input_tokens,self.token_counter)
+        else:
+            fitted,tokens=messages,self.token_counter.count_messages(messages)
+        with self.token_lock:
+            usage=self.token_usage.setdefault(node or 'default',{'calls':0,'prompt_tokens':0,'max_prompt_tokens':0,'trimmed':0})
+            usage['model']=profile.model
+            usage['calls']+=1
+            usage['prompt_tokens']+=tokens
+            usage['max_prompt_tokens']=max(usage['max_prompt_tokens'],tokens)
+            usage['trimmed']+=fitted is not messages
+        return fitted,profile
+
+    def token_stats(self)->dict:
+        '''Prompt tokens sent so far and model used by node, counted locally'''
+        with self.token_lock:
+            return {
+                'counter': self.token_counter.name,
+                'nodes': {node:{**usage,'mean_prompt_tokens':usage['prompt_tokens']/usage['calls']} for node,usage in self.token_usage.items()},
+            }
+
 from .vertex_ai import ChatVertexAI
-from .groq import ChatGroq
\ No newline at end of file
+from .groq import ChatGroq
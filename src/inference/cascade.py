@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.message import AIMessage,BaseMessage
+from src.inference import BaseInference,CallBudgetExceeded
+from contextvars import copy_context
+from typing import Callable,Generator
+from collections import Counter
+from threading import Lock
+from time import perf_counter
+from json import dumps
+
+class CascadeInference(BaseInference):
+    '''
+    Model cascade: the calls of the cascaded nodes go to the small model first and are escalated to the large model
+    only when the response is not trusted. Every other node goes straight to the large model.
+
+    The confidence of a small-model response is the lowest of:
+    - the validator passed by the caller (a bool or a score between 0 and 1), an exception counts as 0
+    - parse validity: a JSON response that is not an object or a list scores 0
+    - the confidence the model reports itself in a "confidence" field of a JSON response
+    - with `samples` > 1, the share of samples agreeing with the most common response
+    The response is escalated below `threshold`.
+    '''
+    def __init__(self,small:BaseInference,large:BaseInference,nodes:set[str]|None=None,threshold:float=0.6,samples:int=1):
+        self.small=small
+        self.large=large
+        self.nodes=nodes if nodes is not None else {'router','simple_plan'}
+        self.threshold=threshold
+        self.samples=samples
+        self.metrics={}
+        self.lock=Lock()
+
+    def __getattr__(self,name):
+        # Settings and backend specific helpers (cache_stats, clear_cache, ...) are the large model's
+        return getattr(self.large,name)
+
+    def confidence(self,response:AIMessage,json:bool,validator:Callable[[AIMessage],bool|float]|None)->float:
+        scores=[1.0]
+        content=response.content
+        if json and not isinstance(content,(dict,list)):
+            return 0.0
+        if isinstance(content,dict) and content.get('confidence') is not None:
+            try:
+                scores.append(float(content['confidence']))
+            except (TypeError,ValueError):
+                pass
+        if validator is not None:
+            try:
+                scores.append(float(validator(response)))
+            except Exception:
+                return 0.0
+        return min(scores)
+
+    def sample(self,messages:list[BaseMessage],**kwargs)->tuple[AIMessage,float]:
+        '''
+        The most common of `samples` small-model responses and the share of samples agreeing with it.
+        '''
+        if self.samples<=1:
+            return self.small.invoke(messages,**kwargs),1.0
+        # Each sample runs in a copy of the caller's context, so an active call budget counts it
+        contexts=[copy_context() for _ in range(self.samples)]
+        with ThreadPoolExecutor(max_workers=self.samples,thread_name_prefix='cascade') as executor:
+            responses=list(executor.map(lambda context:context.run(self.small.invoke,messages,**kwargs),contexts))
+        keys=[dumps(response.content,sort_keys=True) if not isinstance(response.content,str) else response.content.strip() for response in responses]
+        key,count=Counter(keys).most_common(1)[0]
+        return responses[keys.index(key)],count/len(responses)
+
+    def record(self,node:str,escalated:bool,confidence:float,small_latency:float,large_latency:float):
+        with self.lock:
+            metrics=self.metrics.setdefault(node,{'calls':0,'escalations':0,'confidence':0.0,'small_latency':0.0,'large_latency':0.0})
+            metrics['calls']+=1
+            metrics['escalations']+=escalated
+            metrics['confidence']+=confidence
+            metrics['small_latency']+=small_latency
+            metrics['large_latency']+=large_latency
+
+    def invoke(self,messages:list[BaseMessage],json:bool=False,stop:list[str]|None=None,schema:dict|None=None,node:str|None=None,validator:Callable[[AIMessage],bool|float]|None=None,**kwargs)->AIMessage:
+        kwargs={'json':json,'stop':stop,'node':node,**({'schema':schema} if schema is not None else {}),**kwargs}
+        if node not in self.nodes:
+            return self.large.invoke(messages,**kwargs)
+        start=perf_counter()
+        try:
+            response,agreement=self.sample(messages,**kwargs)
+            confidence=min(agreement,self.confidence(response,json or schema is not None,validator))
+        except CallBudgetExceeded:
+            raise
+        except Exception as err:
+            print(f'Warning: Small model failed on {node}, escalating: {err}')
+            response,confidence=None,0.0
+        small_latency=perf_counter()-start
+        escalated=confidence<self.threshold
+        large_latency=0.0
+        if escalated:
+            start=perf_counter()
+            response=self.large.invoke(messages,**kwargs)
+            large_latency=perf_counter()-start
+        self.record(node,escalated,confidence,small_latency,large_latency)
+        return response
+
+    def stream(self,messages:list[BaseMessage],json:bool=False,stop:list[str]|None=None,node:str|None=None)->Generator[str,None,None]:
+        if node not in self.nodes:
+            return self.large.stream(messages,json=json,stop=stop,node=node)
+        # A cascaded response has to be complete before it can be scored
+        return super().stream(messages,json=json,stop=stop,node=node)
+
+    def token_stats(self)->dict:
+        return {'small':self.small.token_stats(),'large':self.large.token_stats()}
+
+    def stats(self)->dict:
+        '''Escalation rate, mean confidence and mean latencies of the cascaded nodes'''
+        with self.lock:
+            nodes={}
+            for node,metrics in self.metrics.items():
+                calls=metrics['calls']
+                escalations=metrics['escalations']
+                nodes[node]={
+                    'calls':calls,
+                    'escalations':escalations,
+                    'escalation_rate':escalations/calls,
+                    'mean_confidence':metrics['confidence']/calls,
+                    'mean_small_latency':metrics['small_latency']/calls,
+                    'mean_large_latency':metrics['large_latency']/escalations if escalations else 0.0,
+                }
+            calls=sum(metrics['calls'] for metrics in self.metrics.values())
+            escalations=sum(metrics['escalations'] for metrics in self.metrics.values())
+            return {
+                'small_model':self.small.model,
+                'large_model':self.large.model,
+                'escalation_rate':escalations/calls if calls else 0.0,
+                'nodes':nodes,
+            }
@@ -0,0 +1,188 @@
+from src.message import AIMessage,BaseMessage,HumanMessage
+from src.inference import BaseInference
+from collections import defaultdict,deque
+from typing import Generator
+from threading import Lock
+from hashlib import sha1
+from time import perf_counter,sleep,time
+from json import dumps,loads
+
+def request_key(messages:str|list[BaseMessage],**kwargs)->str:
+    '''
+    Fingerprint of a request: the messages and the settings that change the response (callables such as validators are left out).
+    '''
+    if isinstance(messages,str):
+        messages=[HumanMessage(messages)]
+    settings={name:value for name,value in kwargs.items() if value is not None and not callable(value)}
+    payload=dumps([[message.to_dict() for message in messages],settings],sort_keys=True,default=str)
+    return sha1(payload.encode()).hexdigest()
+
+class CassetteError(Exception):
+    '''
+    Raised by the replay backend for a request missing from the cassette, or in place of an error that was recorded.
+    '''
+
+class RecordingInference(BaseInference):
+    '''
+    Passes every call through to `llm` and appends the request fingerprint, response and latency to a cassette:
+    a JSONL file with one compact record per call, in the order the calls completed. Streams keep the time offset of
+    each chunk. Errors are recorded too and raised again. Only the fingerprint of the request is kept unless
+    `store_requests` also asks for the messages (for inspection, at the cost of repeating the prompts in every record).
+    '''
+    def __init__(self,llm:BaseInference,path:str,store_requests:bool=False):
+        self.llm=llm
+        self.path=path
+        self.store_requests=store_requests
+        self.sequence=0
+        self.metrics={'calls':0,'errors':0,'latency':0.0}
+        self.lock=Lock()
+
+    def __getattr__(self,name):
+        return getattr(self.llm,name)
+
+    def write(self,record:dict,messages,start:float,latency:float):
+        if self.store_requests:
+            record['messages']=[message.to_dict() for message in ([HumanMessage(messages)] if isinstance(messages,str) else messages)]
+        with self.lock:
+            record={'seq':self.sequence,'time':start,'latency':round(latency,4),**record}
+            self.sequence+=1
+            self.metrics['calls']+=1
+            self.metrics['errors']+='error' in record
+            self.metrics['latency']+=latency
+            with open(self.path,'a',encoding='utf-8') as f:
+                f.write(dumps(record,separators=(',',':'),default=str)+'\n')
+
+    def invoke(self,messages:list[BaseMessage],json:bool=False,stop:list[str]|None=None,node:str|None=None,**kwargs)->AIMessage:
+        kwargs={'json':json,'stop':stop,'node':node,**kwargs}
+        record={'type':'invoke','key':request_key(messages,**kwargs),'node':node,'model':self.llm.model}
+        start,begin=time(),perf_counter()
+        try:
+            response=self.llm.invoke(messages,**kwargs)
+        except Exception as err:
+            self.write({**record,'error':f'{type(err).__name__}: {err}'},messages,start,perf_counter()-begin)
+            raise
+        self.write({**record,'response':response.content},messages,start,perf_counter()-begin)
+        return response
+
+    def stream(self,messages:list[BaseMessage],json:bool=False,stop:list[str]|None=None,node:str|None=None)->Generator[str,None,None]:
+        record={'type':'stream','key':request_key(messages,json=json,stop=stop,node=node),'node':node,'model':self.llm.model}
+        start,begin=time(),perf_counter()
+        chunks=[]
+        try:
+            for chunk in self.llm.stream(messages,json=json,stop=stop,node=node):
+                chunks.append([round(perf_counter()-begin,4),chunk])
+                yield chunk
+        except Exception as err:
+            record['error']=f'{type(err).__name__}: {err}'
+            raise
+        finally:
+            # A stream closed early is recorded with the chunks it produced
+            self.write({**record,'chunks':chunks},messages,start,perf_counter()-begin)
+
+    def token_stats(self)->dict:
+        return self.llm.token_stats()
+
+    def stats(self)->dict:
+        '''Calls recorded so far and their mean latency'''
+        with self.lock:
+            metrics=dict(self.metrics)
+        return {'path':self.path,**metrics,'mean_latency':metrics['latency']/metrics['calls'] if metrics['calls'] else 0.0}
+
+class ReplayInference(BaseInference):
+    '''
+    Serves the responses of a cassette instead of calling a model, so agent runs can be repeated offline.
+
+    With `match="request"` a call gets the next unused response recorded for the same request fingerprint (the last
+    one again once they are used up); with `match="sequence"` the calls get the records in their recorded order
+    whatever they ask, which also replays runs whose prompts are not reproducible (e.g. timestamps in the prompt).
+    `speed` scales the recorded latencies: 1 replays at recorded speed, 2 twice as fast, 0 as fast as possible.
+    A request missing from the cassette raises CassetteError, or goes to `fallback` when one is given.
+    '''
+    def __init__(self,path:str,speed:float=1.0,match:str='request',fallback:BaseInference|None=None,**kwargs):
+        self.path=path
+        self.speed=speed
+        self.match=match
+        self.fallback=fallback
+        self.records:list[dict]=[]
+        with open(path,encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self.records.append(loads(line))
+        self.records.sort(key=lambda record:record.get('seq',0))
+        self.by_key:dict[str,deque[dict]]=defaultdict(deque)
+        for record in self.records:
+            self.by_key[record['key']].append(record)
+        self.last:dict[str,dict]={}
+        self.position=0
+        models={record.get('model') for record in self.records}
+        super().__init__(model=kwargs.pop('model',None) or '|'.join(sorted(filter(None,models))),**kwargs)
+        self.metrics={'served':0,'misses':0,'recorded_latency':0.0,'replay_latency':0.0}
+        self.lock=Lock()
+
+    def next_record(self,key:str)->dict|None:
+        with self.lock:
+            if self.match=='sequence':
+                if self.position>=len(self.records):
+                    return None
+                record=self.records[self.position]
+                self.position+=1
+                return record
+            queue=self.by_key.get(key)
+            if queue:
+                self.last[key]=queue.popleft()
+            return self.last.get(key)
+
+    def wait(self,delay:float):
+        if self.speed and delay>0:
+            sleep(delay/self.speed)
+
+    def record(self,served:bool,recorded_latency:float=0.0,replay_latency:float=0.0):
+        with self.lock:
+            self.metrics['served' if served else 'misses']+=1
+            self.metrics['recorded_latency']+=recorded_latency
+            self.metrics['replay_latency']+=replay_latency
+
+    def invoke(self,messages:list[BaseMessage],json:bool=False,stop:list[str]|None=None,node:str|None=None,**kwargs)->AIMessage:
+        record=self.next_record(request_key(messages,json=json,stop=stop,node=node,**kwargs))
+        if record is None:
+            self.record(False)
+            if self.fallback is None:
+                raise CassetteError(f'No recorded response for this {node or "default"} request in {self.path}')
+            return self.fallback.invoke(messages,json=json,stop=stop,node=node,**kwargs)
+        # Counted like a live call so the token stats of replays compare with production
+        self.prepare(messages,node,json=json,stop=stop)
+        start=perf_counter()
+        self.wait(record.get('latency',0.0))
+        self.record(True,record.get('latency',0.0),perf_counter()-start)
+        if 'error' in record:
+            raise CassetteError(record['error'])
+        if record.get('type')=='stream':
+            return AIMessage(''.join(chunk for _,chunk in record.get('chunks',[])))
+        return AIMessage(record.get('response'))
+
+    def stream(self,messages:list[BaseMessage],json:bool=False,stop:list[str]|None=None,node:str|None=None)->Generator[str,None,None]:
+        record=self.next_record(request_key(messages,json=json,stop=stop,node=node))
+        if record is None:
+            self.record(False)
+            if self.fallback is None:
+                raise CassetteError(f'No recorded response for this {node or "default"} request in {self.path}')
+            yield from self.fallback.stream(messages,json=json,stop=stop,node=node)
+            return
+        self.prepare(messages,node,json=json,stop=stop)
+        start=perf_counter()
+        if record.get('type')=='stream':
+            for offset,chunk in record.get('chunks',[]):
+                self.wait(offset-(perf_counter()-start)*(self.speed or 1))
+                yield chunk
+        else:
+            self.wait(record.get('latency',0.0))
+            yield record.get('response') if isinstance(record.get('response'),str) else dumps(record.get('response'))
+        self.record(True,record.get('latency',0.0),perf_counter()-start)
+        if 'error' in record:
+            raise CassetteError(record['error'])
+
+    def stats(self)->dict:
+        '''Responses served and missed, and the recorded against the replayed model time'''
+        with self.lock:
+            metrics=dict(self.metrics)
+        return {'path':self.path,'records':len(self.records),'speed':self.speed,'match':self.match,**metrics}
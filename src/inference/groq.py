@@ -3,27 +3,35 @@ from tenacity import retry,stop_after_attempt,retry_if_exception_type
 from src.message import AIMessage,BaseMessage
 from src.inference import BaseInference
 from typing import Generator
-from httpx import Client
+from httpx import Client,HTTPStatusError
 from json import loads
 
 class ChatGroq(BaseInference):
     @retry(stop=stop_after_attempt(3),retry=retry_if_exception_type(RequestException))
-    def invoke(self, messages: list[BaseMessage],json:bool=False)->AIMessage:
+    def invoke(self, messages: list[BaseMessage],json:bool=False,stop:list[str]|None=None,schema:dict|None=None,node:str|None=None,**kwargs)->AIMessage:
+        messages,profile=self.prepare(messages,node,json=json,stop=stop)
+        json,stop,max_tokens=profile.json_mode,profile.stop,profile.max_tokens
         self.headers.update({'Authorization': f'Bearer {self.api_key}'})
         headers=self.headers
-        temperature=self.temperature
+        temperature=profile.temperature
         url=self.base_url or "https://api.groq.com/openai/v1/chat/completions"
         messages=[message.to_dict() for message in messages]
         payload={
-            "model": self.model,
+            "model": profile.model,
             "messages": messages,
             "temperature": temperature,
             "stream":False,
         }
+        # JSON mode does not enforce the schema, the response is validated by the caller
+        json=json or schema is not None
         if json:
             payload["response_format"]={
                 "type": "json_object"
             }
+        if stop:
+            payload["stop"]=stop[:4]
+        if max_tokens:
+            payload["max_tokens"]=max_tokens
         try:
             with Client() as client:
                 response=client.post(url=url,json=payload,headers=headers,timeout=None)
@@ -45,14 +53,16 @@ class ChatGroq(BaseInference):
         exit()
     
     @retry(stop=stop_after_attempt(3),retry=retry_if_exception_type(RequestException))
-    def stream(self, messages: list[BaseMessage],json=False)->Generator[str,None,None]:
+    def stream(self, messages: list[BaseMessage],json=False,stop:list[str]|None=None,node:str|None=None,**kwargs)->Generator[str,None,None]:
+        messages,profile=self.prepare(messages,node,json=json,stop=stop)
+        json,stop,max_tokens=profile.json_mode,profile.stop,profile.max_tokens
         self.headers.update({'Authorization': f'Bearer {self.api_key}'})
         headers=self.headers
-        temperature=self.temperature
+        temperature=profile.temperature
         url=self.base_url or "https://api.groq.com/openai/v1/chat/completions"
         messages=[message.to_dict() for message in messages]
         payload={
-            "model": self.model,
+            "model": profile.model,
             "messages": messages,
             "temperature": temperature,
             "stream":True,
@@ -61,22 +71,28 @@ class ChatGroq(BaseInference):
             payload["response_format"]={
                 "type": "json_object"
             }
+        if stop:
+            payload["stop"]=stop[:4]
+        if max_tokens:
+            payload["max_tokens"]=max_tokens
         try:
-            with Client() as client:
-                response=client.post(url=url,json=payload,headers=headers)
-            response.raise_for_status()
-            chunks=response.iter_lines(decode_unicode=True)
-            for chunk in chunks:
-                chunk=chunk.replace('data: ','')
-                if chunk and chunk!='[DONE]':
-                    delta=loads(chunk)['choices'][0]['delta']
-                    yield delta.get('content','')
-        except HTTPError as err:
+            # Closing the generator closes the connection, which aborts the generation
+            with Client(timeout=None) as client, client.stream('POST',url=url,json=payload,headers=headers) as response:
+                if response.is_error:
+                    response.read()
+                response.raise_for_status()
+                for chunk in response.iter_lines():
+                    chunk=chunk.replace('data: ','')
+                    if chunk and chunk!='[DONE]':
+                        delta=loads(chunk)['choices'][0]['delta']
+                        yield delta.get('content') or ''
+        except HTTPStatusError as err:
             err_object=loads(err.response.text)
             print(f'\nError: {err_object["error"]["message"]}\nStatus Code: {err.response.status_code}')
+            exit()
         except ConnectionError as err:
             print(err)
-        exit()
+            exit()
     
     def available_models(self):
         url='https://api.groq.com/openai/v1/models'
@@ -7,24 +7,28 @@ from json import loads
 
 class ChatOllama(BaseInference):
     @retry(stop=stop_after_attempt(3),retry=retry_if_exception_type(RequestException))
-    def invoke(self,messages: list[BaseMessage],json=False)->AIMessage:
+    def invoke(self,messages: list[BaseMessage],json=False,stop:list[str]|None=None,schema:dict|None=None,node:str|None=None,**kwargs)->AIMessage:
+        messages,profile=self.prepare(messages,node,json=json,stop=stop)
+        json,stop,max_tokens=profile.json_mode,profile.stop,profile.max_tokens
         headers=self.headers
-        temperature=self.temperature
+        temperature=profile.temperature
         url=self.base_url or "http://localhost:11434/api/chat"
         payload={
-            "model": self.model,
+            "model": profile.model,
             "messages": [message.to_dict() for message in messages],
             "options":{
                 "temperature": temperature,
+                **({"stop": stop} if stop else {}),
+                **({"num_predict": max_tokens} if max_tokens else {}),
             },
-            "format":'json' if json else '',
+            "format":schema or ('json' if json else ''),
             "stream":False
         }
         try:
             response=post(url=url,json=payload,headers=headers)
             response.raise_for_status()
             json_obj=response.json()
-            if json:
+            if json or schema:
                 content=loads(json_obj['message']['content'])
             else:
                 content=json_obj['message']['content']
@@ -32,29 +36,36 @@ class ChatOllama(BaseInference):
         except HTTPError as err:
             print(f'Error: {err.response.text}, Status Code: {err.response.status_code}')
     
-    def stream(self,messages: list[BaseMessage],json=False)->Generator[str,None,None]:
+    def stream(self,messages: list[BaseMessage],json=False,stop:list[str]|None=None,node:str|None=None,**kwargs)->Generator[str,None,None]:
+        messages,profile=self.prepare(messages,node,json=json,stop=stop)
+        json,stop,max_tokens=profile.json_mode,profile.stop,profile.max_tokens
         headers=self.headers
-        temperature=self.temperature
+        temperature=profile.temperature
         url=self.base_url or "http://localhost:11434/api/chat"
         payload={
-            "model": self.model,
+            "model": profile.model,
             "messages": [message.to_dict() for message in messages],
             "options":{
                 "temperature": temperature,
+                **({"stop": stop} if stop else {}),
+                **({"num_predict": max_tokens} if max_tokens else {}),
             },
             "format":'json' if json else '',
             "stream":True
         }
         try:
-            response=post(url=url,json=payload,headers=headers,stream=True)
-            response.raise_for_status()
-            chunks=response.iter_lines(decode_unicode=True)
-            return (loads(chunk)['message']['content'] for chunk in chunks)
+            # Closing the generator closes the connection, which aborts the generation
+            with post(url=url,json=payload,headers=headers,stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_lines(decode_unicode=True):
+                    if chunk:
+                        yield loads(chunk)['message']['content']
         except HTTPError as err:
             print(f'Error: {err.response.text}, Status Code: {err.response.status_code}')
+            exit()
         except ConnectionError as err:
             print(err)
-        exit()
+            exit()
     
     def available_models(self):
         url='http://localhost:11434/api/tags'
@@ -0,0 +1,40 @@
+from pydantic import BaseModel,Field
+from os import environ
+
+class GenerationProfile(BaseModel):
+    '''
+    Generation settings of a node. Unset fields fall back to the "default" profile, then to the backend settings.
+    '''
+    model: str|None = Field(None, description="Model used for the node, e.g. a cheaper one for short outputs.")
+    temperature: float|None = Field(None, description="Sampling temperature.")
+    max_input_tokens: int|None = Field(None, description="Largest prompt sent for the node, older messages are dropped or shortened beyond it.")
+    max_tokens: int|None = Field(None, description="Output token limit.")
+    stop: list[str]|None = Field(None, description="Sequences ending the generation, added to those given by the caller.")
+    json_mode: bool|None = Field(None, description="Ask for a JSON response.")
+
+    def merge(self,profile:'GenerationProfile|None')->'GenerationProfile':
+        '''
+        This profile with the fields set in `profile` taking precedence.
+        '''
+        if profile is None:
+            return self
+        return self.model_copy(update=profile.model_dump(exclude_none=True))
+
+def default_profiles()->dict[str,GenerationProfile]:
+    '''
+    Profiles applied unless the backend is given its own. LLM_MAX_INPUT_TOKENS caps the prompt of every node and
+    LLM_FAST_MODEL, when set, serves the nodes that only produce a few tokens.
+    '''
+    max_input_tokens=environ.get('LLM_MAX_INPUT_TOKENS')
+    fast_model=environ.get('LLM_FAST_MODEL') or None
+    return {
+        'default': GenerationProfile(max_input_tokens=int(max_input_tokens) if max_input_tokens else None),
+        # The router only answers with one JSON word
+        'router': GenerationProfile(model=fast_model,temperature=0,max_tokens=64,json_mode=True),
+        # A single shell command
+        'tool_install': GenerationProfile(model=fast_model,temperature=0,max_tokens=256,json_mode=True),
+        # Whole tool modules are generated as code inside JSON
+        'tool_generate': GenerationProfile(max_tokens=4096,json_mode=True),
+        'tool_update': GenerationProfile(max_tokens=4096,json_mode=True),
+        'tool_debug': GenerationProfile(max_tokens=4096,json_mode=True),
+    }
@@ -0,0 +1,98 @@
+from src.message import BaseMessage,HumanMessage,SystemMessage
+from functools import lru_cache
+from os import environ
+
+# Tokens taken by the chat format around each message (role, separators)
+MESSAGE_OVERHEAD=4
+
+class TokenCounter:
+    '''
+    Local token counter. The base class is the heuristic fallback: about 4 characters per token for ASCII text
+    and 3 bytes per token otherwise, which costs no more than a length check. Subclass it and override `count`
+    to plug in a real tokenizer.
+    '''
+    name='heuristic'
+
+    def count(self,text:str)->int:
+        text=str(text)
+        if text.isascii():
+            return -(-len(text)//4)
+        return -(-len(text.encode('utf-8'))//3)
+
+    def count_message(self,message:BaseMessage)->int:
+        return self.count(message.content)+MESSAGE_OVERHEAD
+
+    def count_messages(self,messages:list[BaseMessage])->int:
+        return sum(self.count_message(message) for message in messages)
+
+class TiktokenCounter(TokenCounter):
+    '''
+    Exact counts with a tiktoken encoding. Prompts repeat a lot (system prompts, history), so counts are memoized.
+    '''
+    name='tiktoken'
+
+    def __init__(self,encoding:str='cl100k_base',cache_size:int=2048):
+        import tiktoken
+        self.encoding=tiktoken.get_encoding(encoding)
+        self.count=lru_cache(maxsize=cache_size)(self.count)
+
+    def count(self,text:str)->int:
+        return len(self.encoding.encode(str(text),disallowed_special=()))
+
+counters={}
+
+def get_token_counter(name:str|None=None)->TokenCounter:
+    '''
+    The shared counter for `name` (TOKEN_COUNTER, default "auto": tiktoken when it is installed, else the heuristic).
+    '''
+    name=(name or environ.get('TOKEN_COUNTER') or 'auto').lower()
+    if name not in counters:
+        counter=None
+        if name in ('auto','tiktoken'):
+            try:
+                counter=TiktokenCounter(environ.get('TIKTOKEN_ENCODING','cl100k_base'))
+            except ImportError:
+                if name=='tiktoken':
+                    print('Warning: tiktoken is not installed, falling back to the heuristic token counter.')
+        counters[name]=counter or TokenCounter()
+    return counters[name]
+
+def shorten(message:BaseMessage,excess:int,counter:TokenCounter)->BaseMessage:
+    '''
+    Copy of the message without about `excess` tokens cut from the middle of its content.
+    '''
+    content=str(message.content)
+    tokens=counter.count(content)
+    keep=max(0,len(content)*(tokens-excess)//max(tokens,1)-40)
+    shortened=f'{content[:keep*2//3]}\n...[truncated]...\n{content[len(content)-keep//3:] if keep//3 else ""}'
+    copy=type(message).__new__(type(message))
+    copy.__dict__.update(message.__dict__,content=shortened)
+    return copy
+
+def fit_messages(messages:list[BaseMessage],max_tokens:int,counter:TokenCounter)->tuple[list[BaseMessage],int]:
+    '''
+    Fits the prompt in `max_tokens`: the oldest messages between the system messages and the last message are
+    dropped first, then the longest messages are shortened in the middle, the system messages last.
+    Returns the messages and their count.
+    '''
+    counts=[counter.count_message(message) for message in messages]
+    total=sum(counts)
+    if total<=max_tokens:
+        return messages,total
+    messages,counts=list(messages),list(counts)
+    index=next((i for i,message in enumerate(messages) if not isinstance(message,SystemMessage)),len(messages))
+    # Keep the first user message (the query) as well when there is history after it
+    if index<len(messages)-1 and isinstance(messages[index],HumanMessage):
+        index+=1
+    while total>max_tokens and index<len(messages)-1:
+        total-=counts.pop(index)
+        messages.pop(index)
+    for _ in range(len(messages)):
+        if total<=max_tokens:
+            break
+        longest=max(range(len(messages)),key=lambda i:(not isinstance(messages[i],SystemMessage) and counts[i]>MESSAGE_OVERHEAD*4,counts[i]))
+        messages[longest]=shorten(messages[longest],total-max_tokens,counter)
+        total-=counts[longest]
+        counts[longest]=counter.count_message(messages[longest])
+        total+=counts[longest]
+    return messages,total
@@ -1,7 +1,10 @@
 import anthropic
-from typing import Optional, List, Union
-import json
+from typing import Iterator, Optional, List, Union
+import json as json_module
 import os
+from hashlib import sha1
+from threading import Lock
+from time import time
 from google.auth import default
 from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
@@ -9,6 +12,9 @@ import requests
 
 from src.message import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from src.inference import BaseInference
+from src.inference.tokens import TokenCounter
+from src.inference.profile import GenerationProfile
+from src.structured import openapi_schema
 
 
 class ChatVertexAI(BaseInference):
@@ -22,6 +28,11 @@ class ChatVertexAI(BaseInference):
         temperature: float = 0.7,
         max_tokens: int = 2048,
         service_account_path: Optional[str] = None,
+        context_cache: bool = False,
+        cache_ttl: int = 3600,
+        cache_min_tokens: int = 1024,
+        token_counter: Optional[TokenCounter] = None,
+        profiles: Optional[dict[str, GenerationProfile]] = None,
     ):
         """
         Initialize Vertex AI Chat client
@@ -31,13 +42,27 @@ class ChatVertexAI(BaseInference):
             project_id: Google Cloud project ID
             location: Cloud location
             temperature: Temperature for generation
-            max_tokens: Maximum tokens to generate
+            max_tokens: Maximum tokens to generate for the nodes whose profile sets none
             service_account_path: Path to service account JSON file
+            context_cache: Cache the first system message provider-side (cachedContents) and reuse it
+            cache_ttl: Lifetime of a cached content in seconds
+            cache_min_tokens: Estimated size below which a system message is not worth caching
+            token_counter: Local token counter for the prompt budgets (default from TOKEN_COUNTER)
+            profiles: Generation profiles (model, limits, stop sequences, JSON mode) by node name
         """
-        super().__init__(model=model, temperature=temperature)
+        super().__init__(model=model, temperature=temperature, max_tokens=max_tokens, token_counter=token_counter, profiles=profiles)
         self.project_id = project_id or os.environ.get("GOOGLE_CLOUD_PROJECT")
         self.location = location
-        self.max_tokens = max_tokens
+        self.context_cache = context_cache
+        self.cache_ttl = cache_ttl
+        self.cache_min_tokens = cache_min_tokens
+        # sha1 of model and system prompt -> (cached content name, expiry timestamp)
+        self.cached_contents = {}
+        self.uncacheable = set()
+        # Keys whose cached content is being created by another call
+        self.creating = set()
+        self.usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        self.lock = Lock()
         
         # Initialize credentials
         if service_account_path:
@@ -60,83 +85,116 @@ class ChatVertexAI(BaseInference):
             base_url=f"https://{self.location}-aiplatform.googleapis.com/v1beta1/projects/{self.project_id}/locations/{self.location}/endpoints/openapi",
         )
     
-    def invoke(self, messages: Union[str, List[BaseMessage]], json: bool = False, **kwargs) -> AIMessage:
+    def get_headers(self) -> dict:
+        # Get access token from credentials
+        access_token = self.credentials.token
+        if not access_token:
+            self.credentials.refresh(Request())
+            access_token = self.credentials.token
+        return {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+
+    def get_url(self, method: str, model: Optional[str] = None) -> str:
+        return f"https://{self.location}-aiplatform.googleapis.com/v1/projects/{self.project_id}/locations/{self.location}/publishers/google/models/{model or self.model}:{method}"
+
+    def build_payload(self, messages: Union[str, List[BaseMessage]], profile: Optional[GenerationProfile] = None, schema: Optional[dict] = None) -> dict:
+        """
+        Build the request body for the Vertex AI API from the messages and the generation profile
+        """
+        if isinstance(messages, str):
+            messages = [HumanMessage(content=messages)]
+        profile = profile or self.get_profile()
+
+        contents = []
+        system_texts = []
+
+        for msg in messages:
+            if isinstance(msg, SystemMessage):
+                system_texts.append(msg.content)
+            elif isinstance(msg, HumanMessage):
+                contents.append({
+                    "role": "user",
+                    "parts": [{"text": msg.content}]
+                })
+            elif isinstance(msg, AIMessage):
+                contents.append({
+                    "role": "model",
+                    "parts": [{"text": msg.content}]
+                })
+            elif isinstance(msg, dict):
+                role = msg.get("role", "user")
+                if role == "system":
+                    system_texts.append(msg.get("content", ""))
+                else:
+                    contents.append({
+                        "role": "model" if role == "assistant" else "user",
+                        "parts": [{"text": msg.get("content", "")}]
+                    })
+
+        # The first system message is the static prefix; with a cached content the rest of the system
+        # messages cannot go in systemInstruction and lead the conversation as user content instead
+        cached_content = self.get_cached_content(system_texts[0], profile.model) if self.context_cache and system_texts else None
+        system_instruction = None
+        if cached_content:
+            dynamic_parts = [{"text": text} for text in system_texts[1:]]
+            if dynamic_parts:
+                if contents and contents[0]["role"] == "user":
+                    contents[0] = {"role": "user", "parts": dynamic_parts + contents[0]["parts"]}
+                else:
+                    contents.insert(0, {"role": "user", "parts": dynamic_parts})
+        elif system_texts:
+            system_instruction = {"parts": [{"text": text} for text in system_texts]}
+
+        payload = {
+            "contents": contents,
+            "generationConfig": {
+                "temperature": profile.temperature,
+                "maxOutputTokens": profile.max_tokens,
+            }
+        }
+
+        if cached_content:
+            payload["cachedContent"] = cached_content
+        elif system_instruction:
+            payload["systemInstruction"] = system_instruction
+
+        if profile.json_mode or schema:
+            payload["generationConfig"]["response_mime_type"] = "application/json"
+
+        if schema:
+            payload["generationConfig"]["responseSchema"] = openapi_schema(schema)
+
+        if profile.stop:
+            payload["generationConfig"]["stopSequences"] = profile.stop[:5]
+        return payload
+
+    def invoke(self, messages: Union[str, List[BaseMessage]], json: bool = False, stop: Optional[List[str]] = None, schema: Optional[dict] = None, node: Optional[str] = None, **kwargs) -> AIMessage:
         """
         Send a message or list of messages to the model and get a response
         
         Args:
             messages: The prompt text or list of BaseMessage objects
             json: Whether to expect and parse JSON response
+            stop: Sequences that end the generation (at most 5)
+            schema: JSON schema the response must follow (sent as responseSchema)
+            node: Name of the calling node, selects its generation profile
             **kwargs: Additional parameters
             
         Returns:
             AIMessage object
         """
-        if isinstance(messages, str):
-            messages = [HumanMessage(content=messages)]
-
+        # Outside the try: an exhausted call budget (CallBudgetExceeded) has to reach the caller as it is
+        messages, profile = self.prepare(messages, node, json=json, stop=stop)
         try:
             # Use the Vertex AI API directly with proper endpoint
-            # Get access token from credentials
-            access_token = self.credentials.token
-            if not access_token:
-                self.credentials.refresh(Request())
-                access_token = self.credentials.token
-            
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
-            }
-            
-            # Prepare the request body for Vertex AI API
-            url = f"https://{self.location}-aiplatform.googleapis.com/v1/projects/{self.project_id}/locations/{self.location}/publishers/google/models/{self.model}:generateContent"
-            
-            contents = []
-            system_instruction = None
-            
-            for msg in messages:
-                if isinstance(msg, SystemMessage):
-                    system_instruction = {
-                        "parts": [{"text": msg.content}]
-                    }
-                elif isinstance(msg, HumanMessage):
-                    contents.append({
-                        "role": "user",
-                        "parts": [{"text": msg.content}]
-                    })
-                elif isinstance(msg, AIMessage):
-                    contents.append({
-                        "role": "model",
-                        "parts": [{"text": msg.content}]
-                    })
-                elif isinstance(msg, dict):
-                    role = msg.get("role", "user")
-                    if role == "system":
-                        system_instruction = {"parts": [{"text": msg.get("content", "")}]}
-                    else:
-                        contents.append({
-                            "role": "model" if role == "assistant" else "user",
-                            "parts": [{"text": msg.get("content", "")}]
-                        })
-            
-            payload = {
-                "contents": contents,
-                "generationConfig": {
-                    "temperature": self.temperature,
-                    "maxOutputTokens": self.max_tokens,
-                }
-            }
-            
-            if system_instruction:
-                payload["systemInstruction"] = system_instruction
-                
-            if json:
-                payload["generationConfig"]["response_mime_type"] = "application/json"
-            
-            response = requests.post(url, json=payload, headers=headers)
+            payload = self.build_payload(messages, profile, schema=schema)
+            response = requests.post(self.get_url("generateContent", profile.model), json=payload, headers=self.get_headers())
             response.raise_for_status()
             
             result = response.json()
+            self.record_usage(result.get("usageMetadata"))
             
             # Extract text from response
             if "candidates" in result and len(result["candidates"]) > 0:
@@ -145,7 +203,7 @@ class ChatVertexAI(BaseInference):
                     parts = candidate["content"]["parts"]
                     if len(parts) > 0 and "text" in parts[0]:
                         text = parts[0]["text"]
-                        if json:
+                        if profile.json_mode or schema:
                             try:
                                 import json as std_json
                                 content = std_json.loads(text)
@@ -158,7 +216,100 @@ class ChatVertexAI(BaseInference):
             
         except Exception as e:
             raise RuntimeError(f"Error calling Vertex AI API: {str(e)}")
+
+    def stream(self, messages: Union[str, List[BaseMessage]], json: bool = False, stop: Optional[List[str]] = None, node: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """
+        Stream the response text chunk by chunk (server-sent events)
+
+        Closing the generator before the end closes the connection, which aborts the generation.
+        """
+        messages, profile = self.prepare(messages, node, json=json, stop=stop)
+        payload = self.build_payload(messages, profile)
+        try:
+            with requests.post(self.get_url("streamGenerateContent", profile.model) + "?alt=sse", json=payload, headers=self.get_headers(), stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    result = json_module.loads(line[len("data:"):])
+                    # Only the last chunk carries the final usage
+                    if (result.get("candidates") or [{}])[0].get("finishReason"):
+                        self.record_usage(result.get("usageMetadata"))
+                    for candidate in result.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+        except requests.RequestException as e:
+            raise RuntimeError(f"Error calling Vertex AI API: {str(e)}")
     
+    def get_cached_content(self, text: str, model: Optional[str] = None) -> Optional[str]:
+        """
+        Name of the provider-side cached content holding the system prompt for the model, created on first use.
+        Prompts that are too small or rejected by the API are sent inline from then on, and so are the calls made
+        while another call creates the cached content. The request to create it is sent without holding the lock.
+        """
+        model = model or self.model
+        key = sha1(f"{model}\0{text}".encode()).hexdigest()
+        with self.lock:
+            entry = self.cached_contents.get(key)
+            if entry and entry[1] > time() + 60:
+                return entry[0]
+            if key in self.uncacheable or key in self.creating:
+                return None
+            self.creating.add(key)
+        name = None
+        try:
+            if self.token_counter.count(text) >= self.cache_min_tokens:
+                body = {
+                    "model": f"projects/{self.project_id}/locations/{self.location}/publishers/google/models/{model}",
+                    "systemInstruction": {"parts": [{"text": text}]},
+                    "ttl": f"{self.cache_ttl}s",
+                }
+                url = f"https://{self.location}-aiplatform.googleapis.com/v1/projects/{self.project_id}/locations/{self.location}/cachedContents"
+                try:
+                    response = requests.post(url, json=body, headers=self.get_headers())
+                    response.raise_for_status()
+                    name = response.json()["name"]
+                except requests.RequestException as e:
+                    print(f"Warning: Could not cache the system prompt, sending it inline: {e}")
+        finally:
+            with self.lock:
+                self.creating.discard(key)
+                if name:
+                    self.cached_contents[key] = (name, time() + self.cache_ttl)
+                else:
+                    self.uncacheable.add(key)
+        return name
+
+    def clear_cache(self):
+        """Delete the cached contents created by this client"""
+        with self.lock:
+            names = [name for name, _ in self.cached_contents.values()]
+            self.cached_contents.clear()
+        for name in names:
+            try:
+                requests.delete(f"https://{self.location}-aiplatform.googleapis.com/v1/{name}", headers=self.get_headers())
+            except requests.RequestException:
+                pass
+
+    def record_usage(self, usage_metadata: Optional[dict]):
+        if not usage_metadata:
+            return
+        with self.lock:
+            self.usage["calls"] += 1
+            self.usage["prompt_tokens"] += usage_metadata.get("promptTokenCount", 0)
+            self.usage["cached_tokens"] += usage_metadata.get("cachedContentTokenCount", 0)
+
+    def cache_stats(self) -> dict:
+        """Prompt tokens served from the context cache (explicit or implicit) so far"""
+        with self.lock:
+            prompt_tokens = self.usage["prompt_tokens"]
+            return {
+                **self.usage,
+                "cached_token_ratio": self.usage["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+                "cached_contents": len(self.cached_contents),
+            }
+
     def __call__(self, messages: Union[str, List[BaseMessage]], **kwargs) -> AIMessage:
         """Allow object to be called directly"""
         return self.invoke(messages, **kwargs)
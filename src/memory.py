@@ -0,0 +1,162 @@
+from src.message import AIMessage,HumanMessage,SystemMessage,BaseMessage
+from src.parser import parse_tags
+from src.inference.tokens import get_token_counter
+from src.retrieval import BM25Index
+from os import environ
+import re
+
+SENTENCE_PATTERN=re.compile(r'(?<=[.!?])\s+')
+
+def estimate_tokens(messages:list[BaseMessage])->int:
+    return get_token_counter().count_messages(messages)
+
+def extract(text:str,limit:int)->str:
+    '''
+    Leading sentences of the text that fit in `limit` characters (the first one is cut if it is longer).
+    '''
+    text=' '.join(str(text).split())
+    if len(text)<=limit:
+        return text
+    summary=''
+    for sentence in SENTENCE_PATTERN.split(text):
+        if len(summary)+len(sentence)+1>limit:
+            break
+        summary=f'{summary} {sentence}'.strip()
+    return summary or text[:limit-3]+'...'
+
+class WindowMemory:
+    '''
+    Sliding-window view of an agent conversation. The system messages, the question and the last `window`
+    exchanges (a model message and the observations answering it) are kept verbatim, older exchanges are folded
+    into an extractive summary appended to the question. With `max_tokens` the window shrinks further, down to
+    the latest exchange, and then the oldest summarised steps are dropped until the view fits the budget.
+    Without `window` and `max_tokens` the view is the full history. The full history stays in the agent state.
+    '''
+    def __init__(self,window:int|None=None,max_tokens:int|None=None,summary_chars:int=300):
+        self.window=window
+        self.max_tokens=max_tokens
+        self.summary_chars=summary_chars
+
+    def split(self,messages:list[BaseMessage])->tuple[list,list[list]]:
+        head=[]
+        index=0
+        while index<len(messages) and isinstance(messages[index],SystemMessage):
+            head.append(messages[index])
+            index+=1
+        if index<len(messages) and not isinstance(messages[index],AIMessage):
+            head.append(messages[index])
+            index+=1
+        exchanges=[]
+        for message in messages[index:]:
+            if isinstance(message,AIMessage) or not exchanges:
+                exchanges.append([message])
+            else:
+                exchanges[-1].append(message)
+        return head,exchanges
+
+    def summarize_exchange(self,step:int,exchange:list[BaseMessage])->str:
+        parts=[]
+        for message in exchange:
+            parser=parse_tags(str(message.content))
+            if isinstance(message,AIMessage):
+                thought=parser.text('thought')
+                actions=[f'{name} {extract(input,80)}' for name,input in zip(parser.texts('action-name'),parser.texts('action-input'))]
+                query=parser.text('query')
+                text=' | '.join(filter(None,[thought and f'Thought: {extract(thought,self.summary_chars)}',actions and f"Actions: {'; '.join(actions)}",query and f'Query: {extract(query,self.summary_chars)}']))
+                parts.append(text or extract(message.content,self.summary_chars))
+            else:
+                observations=parser.texts('observation')
+                text=' '.join(observations) if observations else message.content
+                parts.append(f'Observation: {extract(text,self.summary_chars)}')
+        return f'Step {step}: '+' -> '.join(parts)
+
+    def summarize(self,exchanges:list[list[BaseMessage]],skipped:int=0)->str:
+        steps='\n'.join(self.summarize_exchange(skipped+step+1,exchange) for step,exchange in enumerate(exchanges))
+        if skipped:
+            steps=f'({skipped} earlier steps omitted)\n{steps}'
+        return f'<Summary of earlier steps>\n{steps}\n</Summary of earlier steps>'
+
+    def view(self,messages:list[BaseMessage])->list[BaseMessage]:
+        '''
+        The messages to send to the LLM for the next step.
+        '''
+        head,exchanges=self.split(messages)
+        window=len(exchanges) if self.window is None else min(self.window,len(exchanges))
+        skipped=0
+        while True:
+            folded,recent=exchanges[skipped:len(exchanges)-window],exchanges[len(exchanges)-window:]
+            view=list(head)
+            if folded or skipped:
+                summary=self.summarize(folded,skipped)
+                if view and isinstance(view[-1],HumanMessage):
+                    view[-1]=HumanMessage(f'{view[-1].content}\n\n{summary}')
+                else:
+                    view.append(HumanMessage(summary))
+            view.extend(message for exchange in recent for message in exchange)
+            if self.max_tokens is None or estimate_tokens(view)<=self.max_tokens:
+                return view
+            # Over budget: shrink the window down to the latest exchange, then drop the oldest summarised steps
+            if window>1:
+                window-=1
+            elif folded:
+                skipped+=1
+            else:
+                return view
+
+class TaskMemory:
+    '''
+    Per-run store of the responses produced so far (task results, expert outputs). Responses are split into
+    chunks indexed with BM25, and a step only receives the chunks most relevant to it, within a token budget,
+    instead of every previous response. Without any lexical match the most recent chunks are used.
+    '''
+    def __init__(self,top_k:int|None=None,max_tokens:int|None=None,chunk_chars:int=800):
+        self.top_k=top_k or int(environ.get('TASK_MEMORY_TOP_K',4))
+        self.max_tokens=max_tokens or int(environ.get('TASK_MEMORY_TOKENS',1500))
+        self.chunk_chars=chunk_chars
+        self.index=BM25Index()
+        self.chunks:list[tuple[str,str]]=[]
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def split(self,text:str)->list[str]:
+        chunks=['']
+        for paragraph in re.split(r'\n\s*\n',str(text).strip()):
+            pieces=[paragraph] if len(paragraph)<=self.chunk_chars else SENTENCE_PATTERN.split(paragraph)
+            for index,piece in enumerate(pieces):
+                while len(piece)>self.chunk_chars:
+                    chunks.append(piece[:self.chunk_chars])
+                    piece=piece[self.chunk_chars:]
+                # Sentences of a long paragraph are rejoined with a space, paragraphs with a blank line
+                separator=' ' if index else '\n\n'
+                if chunks[-1] and len(chunks[-1])+len(piece)+len(separator)>self.chunk_chars:
+                    chunks.append('')
+                chunks[-1]=f'{chunks[-1]}{separator}{piece}' if chunks[-1] else piece
+        return [chunk for chunk in chunks if chunk.strip()]
+
+    def add(self,source:str,text:str):
+        for chunk in self.split(text):
+            self.index.add(len(self.chunks),f'{source} {chunk}')
+            self.chunks.append((source,chunk))
+
+    def retrieve(self,query:str)->list[tuple[str,str]]:
+        '''
+        The relevant (source, chunk) pairs that fit in the token budget, in the order they were added.
+        '''
+        hits=[doc_id for doc_id,_ in self.index.search(query,k=self.top_k)]
+        if not hits:
+            hits=list(range(len(self.chunks)-1,-1,-1))[:self.top_k]
+        selected=[]
+        budget=self.max_tokens
+        counter=get_token_counter()
+        for doc_id in hits:
+            source,chunk=self.chunks[doc_id]
+            tokens=counter.count(f'[{source}] {chunk}')
+            if tokens>budget:
+                continue
+            budget-=tokens
+            selected.append(doc_id)
+        return [self.chunks[doc_id] for doc_id in sorted(selected)]
+
+    def context(self,query:str)->str:
+        return '\n'.join(f'[{source}] {chunk}' for source,chunk in self.retrieve(query))
@@ -0,0 +1,149 @@
+from functools import lru_cache
+import re
+
+TAG_PATTERN=re.compile(r'<(/)?([A-Za-z][A-Za-z0-9_\- ]*?)\s*((?:[A-Za-z_]+\s*=\s*"[^"]*"\s*)*)(/)?>')
+ATTRIBUTE_PATTERN=re.compile(r'([A-Za-z_]+)\s*=\s*"([^"]*)"')
+NAME_PATTERN=re.compile(r'[\s_\-]+')
+OUTER_FENCE_PATTERN=re.compile(r'^\s*```[A-Za-z]*[ \t]*\n(.*?)\n?```\s*$',re.DOTALL)
+
+@lru_cache(maxsize=256)
+def normalize_tag(name:str)->str:
+    '''
+    `Action Name`, `action_name` and `Action-Name` all become `action-name`.
+    '''
+    return NAME_PATTERN.sub('-',name.strip().lower())
+
+class Element:
+    __slots__=('tag','attributes','source','start','end','parent','children')
+
+    def __init__(self,tag:str,attributes:dict,source:'TagParser',start:int,parent:'Element|None'=None):
+        self.tag=tag
+        self.attributes=attributes
+        self.source=source
+        self.start=start
+        self.end=None
+        self.parent=parent
+        self.children:list[Element]=[]
+
+    @property
+    def closed(self)->bool:
+        return self.end is not None
+
+    @property
+    def raw(self)->str:
+        return self.source.buffer[self.start:self.end if self.closed else len(self.source.buffer)]
+
+    @property
+    def text(self)->str:
+        '''
+        Inner text of the element with surrounding whitespace stripped, code blocks inside it are kept.
+        '''
+        return self.raw.strip()
+
+    def find(self,tag:str)->'Element|None':
+        tag=normalize_tag(tag)
+        for child in self.children:
+            if child.tag==tag:
+                return child
+            found=child.find(tag)
+            if found is not None:
+                return found
+        return None
+
+    def find_all(self,tag:str)->list['Element']:
+        tag=normalize_tag(tag)
+        found=[]
+        for child in self.children:
+            if child.tag==tag:
+                found.append(child)
+            found.extend(child.find_all(tag))
+        return found
+
+    def __repr__(self):
+        return f'Element(tag={self.tag}, closed={self.closed})'
+
+class TagParser:
+    '''
+    Single-pass, incremental parser for the XML-like tags the agents answer with.
+    The response is tokenised once; tags are matched case-insensitively with spaces, hyphens and underscores
+    treated alike, unmatched closing tags are ignored and unclosed ones are closed implicitly by their parent.
+    Feed the whole response at once or chunk by chunk while it streams; `on_close` is called for every element
+    as soon as its closing tag arrives.
+    '''
+    def __init__(self,on_close=None):
+        self.buffer=''
+        self.position=0
+        self.root=Element('root',{},self,0)
+        self.stack=[self.root]
+        self.elements:dict[str,list[Element]]={}
+        self.on_close=on_close
+
+    def feed(self,chunk:str)->list[Element]:
+        '''
+        Adds a chunk of the response and returns the elements closed by it.
+        '''
+        self.buffer+=chunk
+        closed=[]
+        for match in TAG_PATTERN.finditer(self.buffer,self.position):
+            self.position=match.end()
+            is_closing,name,attributes,self_closing=match.groups()
+            tag=normalize_tag(name)
+            if is_closing:
+                closed.extend(self.close(tag,match.start()))
+            elif not self_closing:
+                parent=self.stack[-1]
+                element=Element(tag,dict(ATTRIBUTE_PATTERN.findall(attributes)) if attributes else {},self,self.position,parent)
+                parent.children.append(element)
+                self.elements.setdefault(tag,[]).append(element)
+                self.stack.append(element)
+        # A tag may be split across chunks, resume from its `<` once more input arrives
+        start=self.buffer.rfind('<',self.position)
+        if start!=-1 and self.buffer.find('>',start)==-1:
+            self.position=start
+        else:
+            self.position=len(self.buffer)
+        return closed
+
+    def close(self,tag:str,end:int)->list[Element]:
+        for depth in range(len(self.stack)-1,0,-1):
+            if self.stack[depth].tag==tag:
+                closed=[]
+                while len(self.stack)>depth:
+                    element=self.stack.pop()
+                    element.end=end
+                    closed.append(element)
+                    if self.on_close:
+                        self.on_close(element)
+                return closed
+        return []
+
+    def find(self,tag:str,closed:bool=True)->Element|None:
+        '''
+        First element with the tag in document order (only closed ones unless `closed` is False).
+        '''
+        for element in self.elements.get(normalize_tag(tag),[]):
+            if element.closed or not closed:
+                return element
+        return None
+
+    def find_all(self,tag:str)->list[Element]:
+        return [element for element in self.elements.get(normalize_tag(tag),[]) if element.closed]
+
+    def text(self,tag:str)->str|None:
+        element=self.find(tag)
+        return element.text if element is not None else None
+
+    def texts(self,tag:str)->list[str]:
+        return [element.text for element in self.find_all(tag)]
+
+def strip_outer_fence(text:str)->str:
+    '''
+    Removes a code fence wrapping the whole response (```xml ... ```), fences inside it are left alone.
+    '''
+    match=OUTER_FENCE_PATTERN.match(text)
+    return match.group(1) if match else text
+
+def parse_tags(text:str)->TagParser:
+    parser=TagParser()
+    parser.feed(strip_outer_fence(text))
+    return parser
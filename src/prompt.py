@@ -0,0 +1,69 @@
+from string import Formatter
+from threading import Lock
+from pathlib import Path
+import os
+
+class PromptTemplate:
+    def __init__(self,key:str,path:Path,text:str,mtime:float):
+        self.key=key
+        self.path=path
+        self.text=text
+        self.mtime=mtime
+        try:
+            self.fields={field for _,field,_,_ in Formatter().parse(text) if field}
+        except ValueError:
+            self.fields=set()
+
+    def format(self,**kwargs)->str:
+        missing=self.fields-kwargs.keys()
+        if missing:
+            raise KeyError(f'Prompt {self.key} is missing parameters: {", ".join(sorted(missing))}')
+        return self.text.format(**kwargs) if self.fields else self.text
+
+class PromptRegistry:
+    '''
+    Loads every markdown prompt under the root directory once and serves them from memory.
+    Keys are the posix paths relative to the root without the `.md` suffix (e.g. `agent/react/prompt`).
+    With `hot_reload` enabled the file mtime is checked on every lookup and changed prompts are re-read.
+    '''
+    def __init__(self,root:str|Path=Path(__file__).parent,hot_reload:bool=False):
+        self.root=Path(root).resolve()
+        self.hot_reload=hot_reload
+        self.templates:dict[str,PromptTemplate]={}
+        self.reads=0
+        self.lock=Lock()
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.templates={}
+            for path in sorted(self.root.rglob('*.md')):
+                template=self.read(path)
+                self.templates[template.key]=template
+
+    def read(self,path:Path)->PromptTemplate:
+        key=path.relative_to(self.root).with_suffix('').as_posix()
+        with open(path,'r',encoding='utf-8') as f:
+            text=f.read()
+        self.reads+=1
+        return PromptTemplate(key,path,text,path.stat().st_mtime)
+
+    def get_template(self,key:str)->PromptTemplate:
+        key=key.removesuffix('.md')
+        template=self.templates.get(key)
+        if template is None:
+            raise KeyError(f'Prompt {key} not found under {self.root}')
+        if self.hot_reload:
+            mtime=template.path.stat().st_mtime
+            if mtime!=template.mtime:
+                with self.lock:
+                    template=self.templates[key]=self.read(template.path)
+        return template
+
+    def get(self,key:str)->str:
+        return self.get_template(key).text
+
+    def format(self,key:str,**kwargs)->str:
+        return self.get_template(key).format(**kwargs)
+
+prompts=PromptRegistry(hot_reload=os.environ.get('PROMPT_HOT_RELOAD','').lower() in ('1','true','yes'))
@@ -0,0 +1,57 @@
+from collections import Counter
+from math import log
+import re
+
+TOKEN_PATTERN=re.compile(r'[a-z0-9]+')
+STOPWORDS=frozenset('a an and are as at be by for from has have how i in is it its of on or that the this to was what when where which who will with you your'.split())
+
+def tokenize(text:str)->list[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    '''
+    Small in-memory BM25 index for lexical retrieval over short documents (tool descriptions, task notes).
+    Documents can be added incrementally.
+    '''
+    def __init__(self,k1:float=1.5,b:float=0.75):
+        self.k1=k1
+        self.b=b
+        self.ids:list=[]
+        self.documents:list[Counter]=[]
+        self.lengths:list[int]=[]
+        self.frequencies:Counter=Counter()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self,doc_id,text:str):
+        tokens=tokenize(text)
+        counts=Counter(tokens)
+        self.ids.append(doc_id)
+        self.documents.append(counts)
+        self.lengths.append(len(tokens))
+        self.frequencies.update(counts.keys())
+
+    def scores(self,query:str)->list[float]:
+        if not self.ids:
+            return []
+        terms=set(tokenize(query))
+        average_length=sum(self.lengths)/len(self.lengths) or 1
+        total=len(self.ids)
+        idf={term:log(1+(total-self.frequencies[term]+0.5)/(self.frequencies[term]+0.5)) for term in terms if term in self.frequencies}
+        scores=[]
+        for counts,length in zip(self.documents,self.lengths):
+            score=0.0
+            for term,weight in idf.items():
+                frequency=counts.get(term)
+                if frequency:
+                    score+=weight*frequency*(self.k1+1)/(frequency+self.k1*(1-self.b+self.b*length/average_length))
+            scores.append(score)
+        return scores
+
+    def search(self,query:str,k:int=5)->list[tuple]:
+        '''
+        Returns up to k (doc_id, score) pairs with a positive score, best first.
+        '''
+        ranked=sorted(zip(self.ids,self.scores(query)),key=lambda item:item[1],reverse=True)
+        return [(doc_id,score) for doc_id,score in ranked[:k] if score>0]
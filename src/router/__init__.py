@@ -1,19 +1,51 @@
+from src.router.local import get_local_router,route_name
 from src.message import HumanMessage,SystemMessage
-from src.router.utils import read_markdown_file
 from src.inference import BaseInference
+from src.prompt import prompts
 from json import dumps
+from random import random
+from os import environ
 
 class LLMRouter:
-    def __init__(self,routes:list[dict]=[],llm:BaseInference=None,verbose=False):
-        self.system_prompt=read_markdown_file('./src/router/prompt.md')
+    '''
+    Picks a route for a query with the LLM. In "local" mode (ROUTER_MODE) a TF-IDF classifier shared by the routers
+    of the same routes answers first and the LLM is only called when it is not confident; the LLM decisions are
+    logged to train it, and a share of the local decisions (ROUTER_AUDIT_RATE) is checked against the LLM.
+    '''
+    def __init__(self,routes:list[dict]=[],llm:BaseInference=None,verbose=False,mode:str|None=None,audit_rate:float|None=None):
+        self.system_prompt=prompts.get('router/prompt')
         self.routes=dumps(routes,indent=2)
+        self.route_names={route_name(route) for route in routes}-{None}
         self.llm=llm
         self.verbose=verbose
-    
+        self.mode=mode or environ.get('ROUTER_MODE','llm')
+        self.audit_rate=audit_rate if audit_rate is not None else float(environ.get('ROUTER_AUDIT_RATE',0.05))
+        self.local=get_local_router(routes) if self.mode=='local' else None
+
     def invoke(self,query:str)->dict:
-        messages=[SystemMessage(self.system_prompt.format(routes=self.routes)),HumanMessage(query)]
-        response=self.llm.invoke(messages,json=True)
-        route=response.content.get('route')
+        if self.local is None:
+            route=self.llm_route(query)
+        else:
+            predicted,similarity,margin=self.local.predict(query)
+            confident=self.local.confident(predicted,similarity,margin)
+            if confident and random()>=self.audit_rate:
+                route,source=predicted,'local'
+            else:
+                route,source=self.llm_route(query),'audit' if confident else 'llm'
+            self.local.record(query,route,source,predicted=predicted)
+            if self.verbose:
+                print(f"Routed by {'the classifier' if source=='local' else 'the LLM'} (similarity {similarity:.2f}, margin {margin:.2f})")
         if self.verbose:
             print(f"Going to {route.upper()} route")
         return route
+
+    def llm_route(self,query:str)->str:
+        messages=[SystemMessage(self.system_prompt.format(routes=self.routes)),HumanMessage(query)]
+        response=self.llm.invoke(messages,json=True,node='router',validator=self.validate)
+        return response.content.get('route')
+
+    def validate(self,response)->bool:
+        '''
+        A routing decision is only trusted when it names one of the routes.
+        '''
+        return isinstance(response.content,dict) and response.content.get('route') in self.route_names
@@ -0,0 +1,156 @@
+from src.retrieval import tokenize
+from collections import Counter
+from threading import Lock
+from hashlib import sha1
+from math import log,sqrt
+from time import time
+from json import dumps,loads
+import os
+
+def route_name(route:dict)->str|None:
+    # Routes are named by 'route' (plan agent) or 'name' (tool agent)
+    return route.get('route') or route.get('name')
+
+def features(text:str)->Counter:
+    tokens=tokenize(text)
+    return Counter(tokens+[f'{first} {second}' for first,second in zip(tokens,tokens[1:])])
+
+class LocalRouter:
+    '''
+    TF-IDF nearest-centroid classifier over a fixed set of routes, trained on the route descriptions and on the
+    decisions the LLM router made before (appended to a JSONL log so they survive restarts).
+    A prediction is trusted when the best centroid is similar enough to the query, ahead of the runner-up by a
+    margin, and backed by at least `min_examples` logged decisions; otherwise the caller falls back to the LLM.
+    '''
+    def __init__(self,routes:list[dict],log_path:str|None=None,min_similarity:float=0.2,min_margin:float=0.1,min_examples:int=3):
+        self.key=sha1(dumps(routes,sort_keys=True).encode()).hexdigest()[:12]
+        # Routes without a name cannot be predicted
+        routes=[route for route in routes if route_name(route)]
+        self.routes=[route_name(route) for route in routes]
+        self.log_path=log_path
+        self.min_similarity=min_similarity
+        self.min_margin=min_margin
+        self.min_examples=min_examples
+        # (features, route, weight): the descriptions are weak priors, logged decisions are full examples
+        self.examples:list[tuple[Counter,str,float]]=[(features(route.get('description','')),route_name(route),0.5) for route in routes]
+        self.counts=Counter()
+        self.centroids:dict[str,dict[str,float]]={}
+        self.idf:dict[str,float]={}
+        self.dirty=True
+        self.metrics={'calls':0,'local':0,'fallbacks':0,'fallback_agreements':0,'audits':0,'audit_agreements':0}
+        self.lock=Lock()
+        self.load()
+
+    def load(self):
+        if not self.log_path or not os.path.exists(self.log_path):
+            return
+        with open(self.log_path,encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record=loads(line)
+                except ValueError:
+                    continue
+                if record.get('key')==self.key and record.get('source')=='llm' and record.get('route') in self.routes:
+                    self.add(record['query'],record['route'])
+
+    def add(self,query:str,route:str):
+        self.examples.append((features(query),route,1.0))
+        self.counts[route]+=1
+        self.dirty=True
+
+    def fit(self):
+        total=len(self.examples)
+        frequencies=Counter(term for counts,_,_ in self.examples for term in counts)
+        self.idf={term:log((1+total)/(1+frequency))+1 for term,frequency in frequencies.items()}
+        sums:dict[str,Counter]={route:Counter() for route in self.routes}
+        for counts,route,weight in self.examples:
+            vector=self.vectorize(counts)
+            for term,value in vector.items():
+                sums[route][term]+=value*weight
+        self.centroids={route:self.normalize(vector) for route,vector in sums.items()}
+        self.dirty=False
+
+    def normalize(self,vector:dict[str,float])->dict[str,float]:
+        norm=sqrt(sum(value*value for value in vector.values())) or 1.0
+        return {term:value/norm for term,value in vector.items()}
+
+    def vectorize(self,counts:Counter)->dict[str,float]:
+        return self.normalize({term:(1+log(count))*self.idf[term] for term,count in counts.items() if term in self.idf})
+
+    def predict(self,query:str)->tuple[str|None,float,float]:
+        '''
+        The closest route with its cosine similarity and its margin over the runner-up.
+        '''
+        with self.lock:
+            if self.dirty:
+                self.fit()
+            vector=self.vectorize(features(query))
+            scores=sorted(((sum(value*centroid.get(term,0.0) for term,value in vector.items()),route) for route,centroid in self.centroids.items()),reverse=True)
+        if not scores:
+            return None,0.0,0.0
+        (similarity,route),runner_up=scores[0],(scores[1][0] if len(scores)>1 else 0.0)
+        return route,similarity,similarity-runner_up
+
+    def confident(self,route:str|None,similarity:float,margin:float)->bool:
+        return route is not None and similarity>=self.min_similarity and margin>=self.min_margin and self.counts[route]>=self.min_examples
+
+    def record(self,query:str,route:str,source:str,predicted:str|None=None):
+        '''
+        Logs a decision. `source` is "local" for a trusted local prediction, "llm" for a fallback to the LLM and
+        "audit" for a trusted prediction checked against the LLM. LLM decisions train the classifier and score the
+        local prediction made for the same query.
+        '''
+        with self.lock:
+            self.metrics['calls']+=1
+            if source=='local':
+                self.metrics['local']+=1
+            elif source=='audit':
+                self.metrics['audits']+=1
+                self.metrics['audit_agreements']+=predicted==route
+            else:
+                self.metrics['fallbacks']+=1
+                self.metrics['fallback_agreements']+=predicted==route
+            if source!='local' and route in self.routes:
+                self.add(query,route)
+            if self.log_path:
+                with open(self.log_path,'a',encoding='utf-8') as f:
+                    f.write(dumps({'key':self.key,'query':query,'route':route,'source':'local' if source=='local' else 'llm','predicted':predicted,'time':time()})+'\n')
+
+    def stats(self)->dict:
+        with self.lock:
+            metrics=dict(self.metrics)
+            examples=dict(self.counts)
+        calls=metrics['calls']
+        return {
+            **metrics,
+            'examples':examples,
+            'fallback_rate':metrics['fallbacks']/calls if calls else 0.0,
+            # Share of the trusted local predictions the LLM agreed with (sampled audits)
+            'accuracy':metrics['audit_agreements']/metrics['audits'] if metrics['audits'] else None,
+            # Share of the low-confidence predictions that still matched the LLM
+            'fallback_agreement':metrics['fallback_agreements']/metrics['fallbacks'] if metrics['fallbacks'] else None,
+        }
+
+local_routers:dict[str,LocalRouter]={}
+lock=Lock()
+
+def get_local_router(routes:list[dict])->LocalRouter:
+    '''
+    The shared classifier for this set of routes (routers are created per call, the classifier has to outlive them).
+    '''
+    key=sha1(dumps(routes,sort_keys=True).encode()).hexdigest()[:12]
+    with lock:
+        if key not in local_routers:
+            local_routers[key]=LocalRouter(
+                routes,
+                log_path=os.environ.get('ROUTER_LOG','router.history.jsonl') or None,
+                min_similarity=float(os.environ.get('ROUTER_MIN_SIMILARITY',0.2)),
+                min_margin=float(os.environ.get('ROUTER_MIN_MARGIN',0.1)),
+                min_examples=int(os.environ.get('ROUTER_MIN_EXAMPLES',3)),
+            )
+        return local_routers[key]
+
+def router_stats()->dict:
+    with lock:
+        routers=list(local_routers.values())
+    return {'|'.join(router.routes):router.stats() for router in routers}
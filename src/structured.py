@@ -0,0 +1,77 @@
+from pydantic import BaseModel,ValidationError
+from src.message import AIMessage,HumanMessage
+from json import dumps,loads
+
+class StructuredOutputError(Exception):
+    pass
+
+def json_schema(model:type[BaseModel])->dict:
+    '''
+    JSON schema of the model with references inlined, as expected by the JSON modes of the backends.
+    '''
+    schema=model.model_json_schema()
+    definitions=schema.pop('$defs',{})
+    def inline(node):
+        if isinstance(node,dict):
+            if '$ref' in node:
+                return inline(definitions[node['$ref'].split('/')[-1]])
+            return {key:inline(value) for key,value in node.items() if key not in ('title','default')}
+        if isinstance(node,list):
+            return [inline(value) for value in node]
+        return node
+    return inline(schema)
+
+def openapi_schema(schema:dict)->dict:
+    '''
+    Converts a JSON schema to the OpenAPI subset accepted by Vertex AI `responseSchema`
+    (optional fields become `nullable`, properties keep their declaration order).
+    '''
+    schema=dict(schema)
+    variants=schema.pop('anyOf',None)
+    if variants:
+        types=[variant for variant in variants if variant.get('type')!='null']
+        schema={**openapi_schema(types[0]),**schema}
+        if len(types)<len(variants):
+            schema['nullable']=True
+    if 'properties' in schema:
+        schema['properties']={name:openapi_schema(value) for name,value in schema['properties'].items()}
+        schema['propertyOrdering']=list(schema['properties'])
+    if 'items' in schema:
+        schema['items']=openapi_schema(schema['items'])
+    return schema
+
+def schema_instructions(model:type[BaseModel])->str:
+    return (
+        '\n\n### Structured Response:\n'
+        'Respond only with a JSON object that follows the JSON schema below instead of the tag format described above. '
+        'Each field carries the content of the tag with the same name.\n'
+        f'```json\n{dumps(json_schema(model),indent=2)}\n```'
+    )
+
+def validator(model:type[BaseModel]):
+    '''
+    Check of a response against the model, for the backends that score responses (e.g. a model cascade).
+    '''
+    def validate(response)->bool:
+        content=response.content
+        model.model_validate(loads(content) if isinstance(content,str) else content)
+        return True
+    return validate
+
+def invoke_structured(llm,messages:list,model:type[BaseModel],retries:int=1,node:str|None=None)->tuple[BaseModel,str]:
+    '''
+    Invokes the LLM with the schema of the model and validates the response locally.
+    An invalid response is sent back once with the validation error before giving up.
+    Returns the validated model and the response as a JSON string (for the message history).
+    '''
+    schema=json_schema(model)
+    for attempt in range(retries+1):
+        content=llm.invoke(messages,json=True,schema=schema,node=node,validator=validator(model)).content
+        try:
+            data=loads(content) if isinstance(content,str) else content
+            return model.model_validate(data),dumps(data)
+        except (ValidationError,ValueError) as err:
+            error=err
+            raw=content if isinstance(content,str) else dumps(content)
+            messages=[*messages,AIMessage(raw),HumanMessage(f'The response is not valid against the schema:\n{err}\nRespond again with only the corrected JSON object.')]
+    raise StructuredOutputError(f'Invalid structured response from the LLM: {error}')
@@ -1,11 +1,18 @@
 from pydantic import BaseModel
-from inspect import getdoc
+from inspect import getdoc,iscoroutinefunction
 
-def tool(name:str,args_schema:BaseModel):
+def tool(name:str,args_schema:BaseModel,cacheable:bool=False,ttl:float|None=None):
+    '''
+    cacheable: the tool is idempotent, so repeated calls with the same arguments may reuse the result.
+    ttl: seconds a cached result stays valid (None keeps it until evicted).
+    '''
     def wrapper(func):
         func.name = name
         func.schema = args_schema.model_json_schema()
         func.schema.pop('title')
         func.description = getdoc(func)
+        func.cacheable = cacheable
+        func.ttl = ttl
+        func.is_async = iscoroutinefunction(func)
         return func
     return wrapper
\ No newline at end of file
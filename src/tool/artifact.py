@@ -0,0 +1,89 @@
+from weakref import WeakValueDictionary,finalize
+from threading import Lock
+from pathlib import Path
+from uuid import uuid4
+import tempfile
+import shutil
+import os
+
+# handle -> store holding it, so the reader tool can resolve handles from any session
+stores:WeakValueDictionary[str,'ArtifactStore']=WeakValueDictionary()
+
+class ArtifactStore:
+    '''
+    Per-session store for large tool observations. An observation above `threshold` characters is written to
+    disk and replaced in the prompt by a preview (its head and tail) and a handle; the Artifact Reader Tool
+    pages through or searches the full text by handle. Pages stay below the threshold so a page read is never
+    spilled again. The directory is removed with the store.
+    '''
+    # Room for the page header and the truncation note of a reader result
+    page_overhead=100
+
+    def __init__(self,root:str|None=None,threshold:int|None=None,preview_chars:int=1500,page_chars:int=3000):
+        base=root or os.environ.get('ARTIFACT_DIR') or None
+        if base:
+            os.makedirs(base,exist_ok=True)
+        self.root=Path(tempfile.mkdtemp(prefix='artifacts-',dir=base))
+        self.threshold=threshold or int(os.environ.get('ARTIFACT_THRESHOLD',4000))
+        self.preview_chars=preview_chars
+        self.page_chars=max(1,min(page_chars,self.threshold-self.page_overhead))
+        self.handles:dict[str,Path]={}
+        self.lock=Lock()
+        self.finalizer=finalize(self,shutil.rmtree,self.root,True)
+
+    def spill(self,source:str,content)->str:
+        '''
+        Returns the content unchanged when it is small, otherwise stores it and returns the preview with its handle.
+        '''
+        content=str(content)
+        if len(content)<=self.threshold:
+            return content
+        handle=f'artifact-{uuid4().hex[:8]}'
+        path=self.root/f'{handle}.txt'
+        path.write_text(content,encoding='utf-8')
+        with self.lock:
+            self.handles[handle]=path
+        stores[handle]=self
+        head=content[:self.preview_chars*2//3]
+        tail=content[-(self.preview_chars//3):]
+        pages=self.pages(content)
+        return (
+            f'{head}\n...\n{tail}\n'
+            f'[Output of {source} truncated: {len(content)} characters, {content.count(chr(10))+1} lines. '
+            f'The full output is saved as artifact "{handle}". Read it with the Artifact Reader Tool '
+            f'(handle="{handle}", page 1-{pages}, or a search term).]'
+        )
+
+    def pages(self,content:str)->int:
+        return max(1,-(-len(content)//self.page_chars))
+
+    def read(self,handle:str,page:int=1,search:str='')->str:
+        with self.lock:
+            path=self.handles.get(handle)
+        if path is None or not path.exists():
+            return f'Error: Artifact "{handle}" not found.'
+        content=path.read_text(encoding='utf-8')
+        if search:
+            matches=[f'{number}: {line}' for number,line in enumerate(content.splitlines(),1) if search.lower() in line.lower()]
+            if not matches:
+                return f'No lines of "{handle}" contain "{search}".'
+            content='\n'.join(matches)
+            result=content[:self.page_chars]
+            return result+('\n[More matches truncated, use a more specific search term.]' if len(content)>self.page_chars else '')
+        pages=self.pages(content)
+        page=min(max(1,page),pages)
+        start=(page-1)*self.page_chars
+        return f'[{handle} page {page}/{pages}]\n{content[start:start+self.page_chars]}'
+
+    def close(self):
+        with self.lock:
+            for handle in self.handles:
+                stores.pop(handle,None)
+            self.handles.clear()
+        self.finalizer()
+
+def read_artifact(handle:str,page:int=1,search:str='')->str:
+    store=stores.get(handle)
+    if store is None:
+        return f'Error: Artifact "{handle}" not found.'
+    return store.read(handle,page=page,search=search)
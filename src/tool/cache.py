@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+import json
+
+class ToolCache:
+    '''
+    Shared result cache for tools declared with `@tool(...,cacheable=True,ttl=...)`.
+    Entries are keyed by tool name and canonicalised arguments; a `ttl` of None keeps the result until evicted.
+    Failed calls and results starting with "Error" are never cached.
+    '''
+    def __init__(self,max_entries:int=1024):
+        self.max_entries=max_entries
+        self.entries:OrderedDict[tuple,tuple[float|None,object]]=OrderedDict()
+        self.hits:dict[str,int]={}
+        self.misses:dict[str,int]={}
+        self.lock=Lock()
+
+    def key(self,tool,kwargs)->tuple:
+        return (tool.name,json.dumps(kwargs,sort_keys=True,separators=(',',':'),default=str))
+
+    def get(self,key:tuple):
+        with self.lock:
+            entry=self.entries.get(key)
+            if entry is None:
+                return None
+            expires,result=entry
+            if expires is not None and expires<monotonic():
+                self.entries.pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self,key:tuple,result,ttl:float|None):
+        with self.lock:
+            self.entries[key]=(monotonic()+ttl if ttl is not None else None,result)
+            self.entries.move_to_end(key)
+            while len(self.entries)>self.max_entries:
+                self.entries.popitem(last=False)
+
+    def lookup(self,tool,kwargs)->tuple[tuple,tuple|None]:
+        key=self.key(tool,kwargs)
+        entry=self.get(key)
+        with self.lock:
+            counter=self.hits if entry else self.misses
+            counter[tool.name]=counter.get(tool.name,0)+1
+        return key,entry
+
+    def store(self,tool,key:tuple,result):
+        if not str(result).startswith('Error'):
+            self.put(key,result,getattr(tool,'ttl',None))
+
+    def call(self,tool,kwargs,execute):
+        '''
+        Returns the cached result for the call or runs `execute()` and caches its result.
+        '''
+        if not getattr(tool,'cacheable',False):
+            return execute()
+        key,entry=self.lookup(tool,kwargs)
+        if entry:
+            return entry[1]
+        result=execute()
+        self.store(tool,key,result)
+        return result
+
+    async def acall(self,tool,kwargs,execute):
+        '''
+        Async variant of `call` where `execute()` returns an awaitable.
+        '''
+        if not getattr(tool,'cacheable',False):
+            return await execute()
+        key,entry=self.lookup(tool,kwargs)
+        if entry:
+            return entry[1]
+        result=await execute()
+        self.store(tool,key,result)
+        return result
+
+    def invalidate(self,tool_name:str|None=None):
+        with self.lock:
+            if tool_name is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if key[0]==tool_name]:
+                    self.entries.pop(key)
+
+    def stats(self)->dict:
+        with self.lock:
+            hits=sum(self.hits.values())
+            misses=sum(self.misses.values())
+            return {
+                'entries':len(self.entries),
+                'hits':hits,
+                'misses':misses,
+                'hit_rate':hits/(hits+misses) if hits+misses else 0.0,
+                'tools':{name:{'hits':self.hits.get(name,0),'misses':self.misses.get(name,0)} for name in self.hits.keys()|self.misses.keys()}
+            }
+
+tool_cache=ToolCache()
@@ -0,0 +1,124 @@
+from src.tool.registry import tool_definitions
+from threading import RLock
+from hashlib import sha1
+from pathlib import Path
+import json
+import ast
+import os
+
+def span_source(lines:list[str],spans:list)->str:
+    return '\n\n'.join(''.join(lines[start-1:end]).rstrip() for start,end in spans)
+
+def span_hash(lines:list[str],spans:list)->str:
+    return sha1(span_source(lines,spans).encode('utf-8')).hexdigest()
+
+class ToolIndex:
+    '''
+    Persistent index of the tools defined in the dynamic tools module.
+    Each entry maps a tool to its function name, schema class, source line spans and content hash.
+    The index is stored next to the module (e.g. `experimental.index.json`) and is only rebuilt when the
+    module's mtime/size changed and its content hash no longer matches.
+    '''
+    def __init__(self,location:str='experimental.py'):
+        self.location=location
+        self.index_location=str(Path(location).with_suffix('.index.json'))
+        self.signature=None
+        self.hash=None
+        self.entries:dict[str,dict]={}
+        self.names:dict[str,str]={}
+        self.lock=RLock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_location):
+            return
+        try:
+            with open(self.index_location,'r',encoding='utf-8') as f:
+                data=json.load(f)
+            self.signature=tuple(data['signature'])
+            self.hash=data['hash']
+            self.set_entries(data['entries'])
+        except (OSError,ValueError,KeyError,TypeError):
+            self.signature=None
+
+    def dump(self):
+        try:
+            with open(self.index_location,'w',encoding='utf-8') as f:
+                json.dump({'signature':self.signature,'hash':self.hash,'entries':list(self.entries.values())},f)
+        except OSError as err:
+            print(f'Error writing tool index {self.index_location}: {err}')
+
+    def set_entries(self,entries:list[dict]):
+        self.entries={entry['func_name']:entry for entry in entries}
+        self.names={entry['name'].lower():entry['func_name'] for entry in entries}
+
+    def refresh(self):
+        with self.lock:
+            if not os.path.exists(self.location):
+                self.set_entries([])
+                return
+            stat=os.stat(self.location)
+            signature=(stat.st_mtime_ns,stat.st_size)
+            if signature==self.signature:
+                return
+            with open(self.location,'r',encoding='utf-8') as f:
+                source=f.read()
+            content_hash=sha1(source.encode('utf-8')).hexdigest()
+            if content_hash!=self.hash:
+                self.hash=content_hash
+                self.set_entries(self.build(source))
+            self.signature=signature
+            self.dump()
+
+    def build(self,source:str)->list[dict]:
+        lines=source.splitlines(keepends=True)
+        entries:dict[str,dict]={}
+        for definition in tool_definitions(ast.parse(source)):
+            previous=entries.pop(definition['func_name'],None)
+            entries[definition['func_name']]={
+                'name':definition['name'],
+                'func_name':definition['func_name'],
+                'model_name':definition['model_name'],
+                'spans':definition['spans'],
+                'shadowed':(previous['shadowed']+[previous['spans']]) if previous else [],
+                'hash':span_hash(lines,definition['spans'])
+            }
+        return list(entries.values())
+
+    def get(self,name:str)->dict|None:
+        '''
+        Looks a tool up by function name or tool name.
+        '''
+        self.refresh()
+        func_name=name if name in self.entries else self.names.get(name.lower())
+        return self.entries.get(func_name)
+
+    def search(self,query:str)->dict|None:
+        '''
+        Returns the tool whose tool name or function name is mentioned in the query, preferring the longest match.
+        '''
+        self.refresh()
+        entry=self.get(query.strip())
+        if entry:
+            return entry
+        query=query.lower()
+        matches=[(len(name),func_name) for name,func_name in self.names.items() if name in query]
+        matches+=[(len(func_name),func_name) for func_name in self.entries if func_name.lower() in query]
+        return self.entries[max(matches)[1]] if matches else None
+
+    def source(self,entry:dict)->str:
+        with open(self.location,'r',encoding='utf-8') as f:
+            lines=f.readlines()
+        return span_source(lines,entry['spans'])
+
+    def tools(self)->list[dict]:
+        self.refresh()
+        return list(self.entries.values())
+
+indexes:dict[str,ToolIndex]={}
+
+def get_index(location:str='experimental.py')->ToolIndex:
+    key=str(Path(location).resolve())
+    if key not in indexes:
+        indexes[key]=ToolIndex(location)
+    return indexes[key]
@@ -1,4 +1,5 @@
 from pydantic import BaseModel,Field
+from src.tool.artifact import read_artifact
 from src.tool import tool
 
 class UserInteraction(BaseModel):
@@ -11,4 +12,16 @@ def user_interface_tool(question:str):
     '''
     ai_query=f'AI: {question}\nUser: '
     user_message=input(ai_query)
-    return user_message
\ No newline at end of file
+    return user_message
+
+class ArtifactReader(BaseModel):
+    handle: str = Field(..., description="The artifact handle given in a truncated observation.", example="artifact-1a2b3c4d")
+    page: int = Field(1, description="The page to read, starting at 1.", example=2)
+    search: str = Field('', description="Optional text to look for; returns the matching lines instead of a page.", example="error")
+
+@tool('Artifact Reader Tool',args_schema=ArtifactReader)
+def artifact_reader_tool(handle:str,page:int=1,search:str=''):
+    '''
+    Reads the full output of a tool that was truncated in an observation, page by page or by searching for a text.
+    '''
+    return read_artifact(handle,page=page,search=search)
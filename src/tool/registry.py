@@ -0,0 +1,168 @@
+from types import ModuleType
+from threading import RLock
+from hashlib import sha1
+from pathlib import Path
+import ast
+
+class ToolUnit:
+    '''
+    A single tool of the dynamic tools module: the args schema class plus the decorated function.
+    '''
+    def __init__(self,name:str,func_name:str,model_name:str,source:str,lineno:int):
+        self.name=name
+        self.func_name=func_name
+        self.model_name=model_name
+        self.source=source
+        self.lineno=lineno
+        self.hash=sha1(source.encode('utf-8')).hexdigest()
+        self.version=0
+        self.func=None
+
+def tool_decorator_args(node:ast.FunctionDef)->tuple[str,str]|None:
+    for decorator in node.decorator_list:
+        if isinstance(decorator,ast.Call) and getattr(decorator.func,'id',None)=='tool':
+            name=decorator.args[0].value if decorator.args and isinstance(decorator.args[0],ast.Constant) else node.name
+            schema=decorator.args[1] if len(decorator.args)>1 else next((keyword.value for keyword in decorator.keywords if keyword.arg=='args_schema'),None)
+            return name,getattr(schema,'id','')
+    return None
+
+def tool_definitions(tree:ast.Module)->list[dict]:
+    '''
+    Lists every tool definition of the module in order with the line spans of its schema class and function.
+    '''
+    classes:dict[str,ast.ClassDef]={}
+    definitions=[]
+    for node in tree.body:
+        if isinstance(node,ast.ClassDef):
+            classes[node.name]=node
+        elif isinstance(node,ast.FunctionDef) and (args:=tool_decorator_args(node)):
+            name,model_name=args
+            spans=[]
+            model=classes.get(model_name)
+            if model is not None:
+                spans.append((min([model.lineno,*(d.lineno for d in model.decorator_list)]),model.end_lineno))
+            spans.append((min([node.lineno,*(d.lineno for d in node.decorator_list)]),node.end_lineno))
+            definitions.append({'name':name,'func_name':node.name,'model_name':model_name,'spans':spans,'nodes':[model,node] if model is not None else [node]})
+    return definitions
+
+def split_tools(source:str)->tuple[str,dict[str,ToolUnit]]:
+    '''
+    Splits the module source into the shared header (imports and other statements) and one unit per tool.
+    When a tool is defined several times the last definition wins, as it would on import.
+    '''
+    tree=ast.parse(source)
+    lines=source.splitlines(keepends=True)
+    units:dict[str,ToolUnit]={}
+    for definition in tool_definitions(tree):
+        unit_source='\n'.join(''.join(lines[start-1:end]).rstrip() for start,end in definition['spans'])+'\n'
+        units.pop(definition['func_name'],None)
+        units[definition['func_name']]=ToolUnit(definition['name'],definition['func_name'],definition['model_name'],unit_source,definition['spans'][0][0])
+    model_names={unit.model_name for unit in units.values()}
+    header_nodes=[node for node in tree.body if not isinstance(node,(ast.ClassDef,ast.FunctionDef)) or (isinstance(node,ast.ClassDef) and node.name not in model_names) or (isinstance(node,ast.FunctionDef) and not tool_decorator_args(node))]
+    header='\n'.join(ast.get_source_segment(source,node) for node in header_nodes)
+    return header,units
+
+class ToolRegistry:
+    '''
+    Incremental loader for the dynamic tools module (e.g. `experimental.py`).
+    Every tool is compiled into its own namespace on top of the shared module header, so a change to one tool
+    recompiles only that tool instead of reloading the whole module.
+    '''
+    def __init__(self,location:str='experimental.py'):
+        self.location=location
+        self.module_name=Path(location).stem
+        self.header=None
+        self.namespace={}
+        self.units:dict[str,ToolUnit]={}
+        self.signature=None
+        self.compiled=0
+        self.lock=RLock()
+
+    def sync(self)->list[str]:
+        '''
+        Re-scans the module when it changed on disk and (re)compiles only the tools whose source changed.
+        Returns the function names of the tools that were compiled.
+        '''
+        with self.lock:
+            path=Path(self.location)
+            if not path.exists():
+                self.units.clear()
+                return []
+            stat=path.stat()
+            signature=(stat.st_mtime_ns,stat.st_size)
+            if signature==self.signature:
+                return []
+            self.signature=signature
+            with open(path,'r',encoding='utf-8') as f:
+                header,units=split_tools(f.read())
+            if header!=self.header:
+                self.header=header
+                self.namespace={'__name__':self.module_name,'__file__':str(path)}
+                exec(compile(header,str(path),'exec'),self.namespace)
+                stale=units.keys()
+            else:
+                stale=[func_name for func_name,unit in units.items() if func_name not in self.units or self.units[func_name].hash!=unit.hash]
+            for func_name in list(self.units):
+                if func_name not in units:
+                    self.unload(func_name)
+            for func_name,unit in units.items():
+                if func_name in stale:
+                    previous=self.units.get(func_name)
+                    unit.version=previous.version+1 if previous else 1
+                    try:
+                        self.compile(unit)
+                    except Exception as err:
+                        print(f'Error loading tool {func_name}: {err}')
+                        continue
+                    self.units[func_name]=unit
+            return list(stale)
+
+    def compile(self,unit:ToolUnit):
+        module=ModuleType(f'{self.module_name}.{unit.func_name}')
+        module.__dict__.update(self.namespace)
+        module.__name__=f'{self.module_name}.{unit.func_name}'
+        tree=ast.parse(unit.source)
+        ast.increment_lineno(tree,unit.lineno-1)
+        exec(compile(tree,self.location,'exec'),module.__dict__)
+        unit.func=getattr(module,unit.func_name)
+        unit.func.version=unit.version
+        unit.func.unit=unit
+        unit.func.header=self.header
+        unit.func.location=self.location
+        self.compiled+=1
+
+    def find(self,name:str)->ToolUnit|None:
+        unit=self.units.get(name)
+        if unit is None:
+            unit=next((unit for unit in self.units.values() if unit.name==name),None)
+        return unit
+
+    def load(self,name:str):
+        '''
+        Returns the up-to-date tool by function name or tool name.
+        '''
+        with self.lock:
+            self.sync()
+            unit=self.find(name)
+            if unit is None:
+                raise AttributeError(f'Tool {name} not found in {self.location}. Available tools: {list(self.units)}')
+            return unit.func
+
+    def unload(self,name:str):
+        with self.lock:
+            unit=self.find(name)
+            if unit is not None:
+                self.units.pop(unit.func_name)
+
+    def tools(self)->list:
+        with self.lock:
+            self.sync()
+            return [unit.func for unit in self.units.values()]
+
+registries:dict[str,ToolRegistry]={}
+
+def get_registry(location:str='experimental.py')->ToolRegistry:
+    key=str(Path(location).resolve())
+    if key not in registries:
+        registries[key]=ToolRegistry(location)
+    return registries[key]
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread,Lock
+import asyncio
+import os
+
+class ToolRuntime:
+    '''
+    Shared event loop on a background thread for running tools.
+    Async tools are awaited directly on the loop, sync tools are offloaded to a bounded thread pool,
+    so I/O-bound async tools do not need a thread each.
+    '''
+    def __init__(self,max_workers:int=16):
+        self.max_workers=max_workers
+        self.loop=None
+        self.executor=None
+        self.lock=Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.executor=ThreadPoolExecutor(max_workers=self.max_workers,thread_name_prefix='tool')
+            self.loop=asyncio.new_event_loop()
+            self.loop.set_default_executor(self.executor)
+            Thread(target=self.loop.run_forever,name='tool-loop',daemon=True).start()
+
+    def run(self,coroutine):
+        '''
+        Runs the coroutine on the shared loop and blocks the calling thread until it finishes.
+        '''
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine,self.loop).result()
+
+    async def offload(self,func,*args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor,func,*args)
+
+tool_runtime=ToolRuntime(max_workers=int(os.environ.get('TOOL_RUNTIME_WORKERS',16)))
@@ -0,0 +1,236 @@
+from threading import Lock,Condition
+from hashlib import sha1
+from pathlib import Path
+import subprocess
+import asyncio
+import select
+import signal
+import json
+import sys
+import ast
+import os
+
+ROOT=Path(__file__).resolve().parents[2]
+
+class SandboxError(Exception):
+    pass
+
+class SandboxWorker:
+    '''
+    A pre-started Python process (`python -m src.tool.sandbox`) that runs generated tools in its own session.
+    Requests and responses are exchanged as JSON lines over the worker's stdin/stdout.
+    '''
+    def __init__(self,memory_mb:int=4096,cpu_seconds:int=30):
+        env={
+            **os.environ,
+            'PYTHONPATH':os.pathsep.join(filter(None,[str(ROOT),os.environ.get('PYTHONPATH')])),
+            'SANDBOX_MEMORY_MB':str(memory_mb),
+            'SANDBOX_CPU_SECONDS':str(cpu_seconds)
+        }
+        self.process=subprocess.Popen([sys.executable,'-m','src.tool.sandbox'],env=env,stdin=subprocess.PIPE,stdout=subprocess.PIPE,
+        text=True,encoding='utf-8',start_new_session=True)
+
+    def alive(self)->bool:
+        return self.process.poll() is None
+
+    def call(self,request:dict,timeout:float)->dict:
+        self.process.stdin.write(json.dumps(request)+'\n')
+        self.process.stdin.flush()
+        ready,_,_=select.select([self.process.stdout],[],[],timeout)
+        if not ready:
+            self.kill()
+            raise TimeoutError(f'Tool call timed out after {timeout} seconds.')
+        line=self.process.stdout.readline()
+        if not line:
+            code=self.process.wait()
+            reason='CPU or memory limit exceeded' if code in (-signal.SIGXCPU,-signal.SIGKILL,-signal.SIGSEGV) else f'exit code {code}'
+            raise SandboxError(f'Tool worker died ({reason}).')
+        return json.loads(line)
+
+    def kill(self):
+        # The worker leads its own session, so this also kills any shell commands the tool started
+        try:
+            os.killpg(self.process.pid,signal.SIGKILL)
+        except (ProcessLookupError,PermissionError):
+            pass
+        self.process.wait()
+
+class SandboxPool:
+    '''
+    Pool of pre-warmed sandbox workers for running generated tools out of process with a per-call timeout,
+    memory/CPU rlimits and a cap on the returned output. A worker that times out, is cancelled or dies is killed
+    (together with its process group) and replaced. A `memory_mb` of 0 leaves the address space unlimited.
+    '''
+    def __init__(self,size:int=4,timeout:float=60,memory_mb:int=4096,cpu_seconds:int=30,max_output:int=20000):
+        self.size=size
+        self.timeout=timeout
+        self.memory_mb=memory_mb
+        self.cpu_seconds=cpu_seconds
+        self.max_output=max_output
+        self.idle:list[SandboxWorker]=[]
+        self.busy:set[SandboxWorker]=set()
+        self.closed=False
+        self.condition=Condition(Lock())
+
+    def spawn(self)->SandboxWorker:
+        return SandboxWorker(memory_mb=self.memory_mb,cpu_seconds=self.cpu_seconds)
+
+    def warm(self):
+        with self.condition:
+            while len(self.idle)+len(self.busy)<self.size:
+                self.idle.append(self.spawn())
+
+    def acquire(self)->SandboxWorker:
+        with self.condition:
+            while not self.idle and len(self.busy)>=self.size:
+                self.condition.wait()
+            worker=self.idle.pop() if self.idle else None
+            if worker is None or not worker.alive():
+                worker=self.spawn()
+            self.busy.add(worker)
+            return worker
+
+    def release(self,worker:SandboxWorker):
+        with self.condition:
+            self.busy.discard(worker)
+            if worker.alive() or self.closed:
+                if worker.alive():
+                    self.idle.append(worker)
+                self.condition.notify()
+                return
+        # A killed worker is replaced right away so the next call does not wait for a process to start
+        replacement=self.spawn()
+        with self.condition:
+            if not self.closed and len(self.idle)+len(self.busy)<self.size:
+                self.idle.append(replacement)
+                replacement=None
+            self.condition.notify()
+        if replacement is not None:
+            replacement.kill()
+
+    def request(self,tool,kwargs:dict)->dict:
+        unit=tool.unit
+        header=tool.header
+        return {
+            'key':f'{sha1(header.encode("utf-8")).hexdigest()}:{unit.hash}',
+            'header':header,
+            'source':unit.source,
+            'lineno':unit.lineno,
+            'location':tool.location,
+            'func_name':unit.func_name,
+            'kwargs':kwargs,
+            'max_output':self.max_output
+        }
+
+    def call(self,tool,kwargs:dict,timeout:float|None=None):
+        '''
+        Runs a registry-loaded tool in a worker and returns its result as a string.
+        '''
+        request=self.request(tool,kwargs)
+        worker=self.acquire()
+        try:
+            response=worker.call(request,timeout or self.timeout)
+        except BaseException:
+            worker.kill()
+            raise
+        finally:
+            self.release(worker)
+        if response.get('error'):
+            raise SandboxError(response['error'])
+        return response.get('output')
+
+    async def acall(self,tool,kwargs:dict,timeout:float|None=None):
+        '''
+        Async variant of `call` for the tool runtime's loop. Cancelling the awaiting coroutine (e.g. with
+        `asyncio.wait_for`) kills the worker running the tool, with its process group, and replaces it.
+        '''
+        loop=asyncio.get_running_loop()
+        request=self.request(tool,kwargs)
+        acquiring=loop.run_in_executor(None,self.acquire)
+        try:
+            worker=await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The worker may still be handed out after the cancellation, give it back then
+            acquiring.add_done_callback(lambda future:future.cancelled() or future.exception() or self.release(future.result()))
+            raise
+        try:
+            response=await loop.run_in_executor(None,worker.call,request,timeout or self.timeout)
+        except BaseException:
+            # Also on cancellation: the thread blocked on the worker sees it die and returns
+            worker.kill()
+            raise
+        finally:
+            self.release(worker)
+        if response.get('error'):
+            raise SandboxError(response['error'])
+        return response.get('output')
+
+    def shutdown(self):
+        with self.condition:
+            self.closed=True
+            workers=self.idle+list(self.busy)
+            self.idle.clear()
+        for worker in workers:
+            worker.kill()
+
+sandbox:SandboxPool|None=None
+
+def get_sandbox()->SandboxPool|None:
+    '''
+    Returns the shared sandbox pool, or None where process groups and rlimits are not available (Windows).
+    '''
+    global sandbox
+    if os.name!='posix':
+        return None
+    if sandbox is None:
+        sandbox=SandboxPool(
+            size=int(os.environ.get('SANDBOX_WORKERS',4)),
+            timeout=float(os.environ.get('SANDBOX_TIMEOUT',60)),
+            memory_mb=int(os.environ.get('SANDBOX_MEMORY_MB',4096)),
+            cpu_seconds=int(os.environ.get('SANDBOX_CPU_SECONDS',30)),
+            max_output=int(os.environ.get('SANDBOX_MAX_OUTPUT',20000))
+        )
+        sandbox.warm()
+    return sandbox
+
+def serve():
+    import resource
+    # Pre-import what every generated tool header needs so the first call does not pay for it
+    import pydantic,dotenv,src.tool
+    channel=os.fdopen(os.dup(1),'w',encoding='utf-8')
+    # Anything the tools print goes to stderr so it cannot corrupt the response channel
+    os.dup2(2,1)
+    memory=int(os.environ.get('SANDBOX_MEMORY_MB',4096))*1024*1024
+    cpu_seconds=int(os.environ.get('SANDBOX_CPU_SECONDS',30))
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS,(memory,memory))
+    _,cpu_hard=resource.getrlimit(resource.RLIMIT_CPU)
+    tools={}
+    for line in sys.stdin:
+        request=json.loads(line)
+        try:
+            tool=tools.get(request['key'])
+            if tool is None:
+                namespace={'__name__':Path(request['location']).stem,'__file__':request['location']}
+                exec(compile(request['header'],request['location'],'exec'),namespace)
+                tree=ast.parse(request['source'])
+                ast.increment_lineno(tree,request['lineno']-1)
+                exec(compile(tree,request['location'],'exec'),namespace)
+                tool=tools[request['key']]=namespace[request['func_name']]
+            usage=resource.getrusage(resource.RUSAGE_SELF)
+            cpu_limit=int(usage.ru_utime+usage.ru_stime)+cpu_seconds
+            resource.setrlimit(resource.RLIMIT_CPU,(cpu_limit if cpu_hard==resource.RLIM_INFINITY else min(cpu_limit,cpu_hard),cpu_hard))
+            output=tool(**request['kwargs'])
+            if asyncio.iscoroutine(output):
+                output=asyncio.run(output)
+            output=str(output)
+            if len(output)>request['max_output']:
+                output=f"{output[:request['max_output']]}\n... [output truncated, {len(output)-request['max_output']} more characters]"
+            response={'output':output}
+        except Exception as err:
+            response={'error':f'{type(err).__name__}: {err}'}
+        channel.write(json.dumps(response)+'\n')
+        channel.flush()
+
+if __name__=='__main__':
+    serve()
@@ -0,0 +1,140 @@
+from src.tool.registry import tool_definitions
+from src.tool.index import get_index,span_hash,span_source
+from threading import Lock,Thread
+from textwrap import dedent
+from pathlib import Path
+from time import time
+import json
+import ast
+import os
+
+class ToolStore:
+    '''
+    Keeps exactly one active definition per tool in the dynamic tools module.
+    Saving a tool that already exists replaces it in place; replaced and shadowed definitions are archived
+    to an append-only history file next to the module (e.g. `experimental.history.jsonl`).
+    '''
+    def __init__(self,location:str='experimental.py'):
+        self.location=location
+        self.history_location=str(Path(location).with_suffix('.history.jsonl'))
+        self.index=get_index(location)
+        self.lock=Lock()
+        self.compactor=None
+
+    def read(self)->str:
+        with open(self.location,'r',encoding='utf-8') as f:
+            return f.read()
+
+    def write(self,source:str):
+        temp_location=f'{self.location}.tmp'
+        with open(temp_location,'w',encoding='utf-8') as f:
+            f.write(source)
+        os.replace(temp_location,self.location)
+
+    def archive(self,definitions:list[dict],lines:list[str]):
+        if not definitions:
+            return
+        with open(self.history_location,'a',encoding='utf-8') as f:
+            for definition in definitions:
+                source=span_source(lines,definition['spans'])
+                f.write(json.dumps({
+                    'name':definition['name'],
+                    'func_name':definition['func_name'],
+                    'hash':span_hash(lines,definition['spans']),
+                    'archived_at':time(),
+                    'source':source
+                })+'\n')
+
+    def splice(self,lines:list[str],spans:list[tuple[int,int]],insert_at:int=-1,insert:str='')->str:
+        dropped={index for start,end in spans for index in range(start-1,end)}
+        output=[]
+        for index,line in enumerate(lines):
+            if index==insert_at:
+                output.append(insert)
+            if index not in dropped:
+                output.append(line)
+        source=''.join(output)
+        while '\n\n\n\n' in source:
+            source=source.replace('\n\n\n\n','\n\n\n')
+        return source
+
+    def definitions(self,entry:dict)->list[dict]:
+        return [{'name':entry['name'],'func_name':entry['func_name'],'spans':spans} for spans in [*entry['shadowed'],entry['spans']]]
+
+    def save(self,tool_data:dict):
+        '''
+        Writes the tool as the only active version of its function, archiving any previous definitions.
+        Only the line spans of the affected tool are rewritten.
+        '''
+        tool_source=dedent(tool_data.get('tool')).strip()
+        tool_lines=tool_source.splitlines(keepends=True)
+        new_definitions=tool_definitions(ast.parse(tool_source))
+        func_name=new_definitions[-1]['func_name'] if new_definitions else tool_data.get('tool_name')
+        with self.lock:
+            entry=self.index.get(func_name)
+            source=self.read()
+            if entry is None:
+                self.write(f"{source.rstrip()}\n\n{tool_source}\n\n")
+                return
+            if new_definitions and not entry['shadowed'] and entry['hash']==span_hash(tool_lines,new_definitions[-1]['spans']):
+                return
+            lines=source.splitlines(keepends=True)
+            definitions=self.definitions(entry)
+            self.archive(definitions,lines)
+            spans=[span for definition in definitions for span in definition['spans']]
+            self.write(self.splice(lines,spans,insert_at=entry['spans'][0][0]-1,insert=f'{tool_source}\n\n'))
+
+    def remove(self,name:str)->bool:
+        '''
+        Archives and removes every definition of the tool. Returns False if the tool does not exist.
+        '''
+        with self.lock:
+            entry=self.index.get(name)
+            if entry is None:
+                return False
+            lines=self.read().splitlines(keepends=True)
+            definitions=self.definitions(entry)
+            self.archive(definitions,lines)
+            self.write(self.splice(lines,[span for definition in definitions for span in definition['spans']]))
+            return True
+
+    def compact(self)->int:
+        '''
+        Archives every shadowed tool definition and removes it from the module.
+        Returns the number of definitions removed.
+        '''
+        with self.lock:
+            entries=self.index.tools()
+            active_spans={tuple(span) for entry in entries for span in entry['spans']}
+            shadowed=[{'name':entry['name'],'func_name':entry['func_name'],'spans':spans} for entry in entries for spans in entry['shadowed']]
+            if not shadowed:
+                return 0
+            lines=self.read().splitlines(keepends=True)
+            self.archive(shadowed,lines)
+            spans=[span for definition in shadowed for span in definition['spans'] if tuple(span) not in active_spans]
+            self.write(self.splice(lines,spans))
+            return len(shadowed)
+
+    def compact_async(self):
+        '''
+        Runs `compact` on a background thread unless a compaction is already running.
+        '''
+        if self.compactor and self.compactor.is_alive():
+            return
+        self.compactor=Thread(target=self.compact,name=f'compact-{Path(self.location).stem}',daemon=True)
+        self.compactor.start()
+
+    def history(self,func_name:str)->list[dict]:
+        if not os.path.exists(self.history_location):
+            return []
+        with open(self.history_location,'r',encoding='utf-8') as f:
+            entries=[json.loads(line) for line in f if line.strip()]
+        return [entry for entry in entries if entry.get('func_name')==func_name]
+
+stores:dict[str,ToolStore]={}
+
+def get_store(location:str='experimental.py')->ToolStore:
+    key=str(Path(location).resolve())
+    if key not in stores:
+        stores[key]=ToolStore(location)
+    return stores[key]
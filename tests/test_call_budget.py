@@ -0,0 +1,43 @@
+import pytest
+import src.inference.vertex_ai as vertex_ai
+from src.inference import CallBudgetExceeded,llm_call_budget
+from src.inference.cascade import CascadeInference
+from src.inference.vertex_ai import ChatVertexAI
+
+class Response:
+    def __init__(self,text:str):
+        self.text=text
+
+    def raise_for_status(self):
+        pass
+
+    def json(self)->dict:
+        return {'candidates':[{'content':{'parts':[{'text':self.text}]}}]}
+
+@pytest.fixture
+def requests_made(monkeypatch)->list:
+    requests_made=[]
+    monkeypatch.setattr(vertex_ai,'default',lambda scopes:(None,None))
+    monkeypatch.setattr(ChatVertexAI,'get_headers',lambda self:{})
+    def post(url,json=None,headers=None):
+        requests_made.append(url)
+        return Response('{"route": "simple"}')
+    monkeypatch.setattr(vertex_ai.requests,'post',post)
+    return requests_made
+
+def test_vertex_raises_call_budget_exceeded(requests_made):
+    llm=ChatVertexAI(project_id='project')
+    with llm_call_budget(1):
+        assert llm.invoke('hi',json=True,node='router').content=={'route':'simple'}
+        with pytest.raises(CallBudgetExceeded):
+            llm.invoke('hi',json=True,node='router')
+    assert len(requests_made)==1
+
+def test_cascade_does_not_escalate_an_exhausted_budget(requests_made):
+    small,large=ChatVertexAI(model='small',project_id='project'),ChatVertexAI(model='large',project_id='project')
+    llm=CascadeInference(small=small,large=large,nodes={'router'})
+    with llm_call_budget(0):
+        with pytest.raises(CallBudgetExceeded):
+            llm.invoke('hi',json=True,node='router')
+    assert requests_made==[]
+    assert llm.stats()['nodes']=={}
@@ -0,0 +1,43 @@
+import pytest
+import src.agent.plan as plan_agent
+from src.agent.plan import PlanAgent
+from src.agent.plan.cache import PlanCache
+
+QUERY='Read the csv files in data and summarize them into report.md'
+PLAN=['List the csv files in data','Read each file','Write a summary of the files to report.md']
+
+def test_replaced_values_are_substituted():
+    cache=PlanCache()
+    cache.put(QUERY,'simple',PLAN)
+    assert cache.get(QUERY.replace('in data','in logs'))==('simple',['List the csv files in logs','Read each file','Write a summary of the files to report.md'])
+
+def test_replacement_missing_from_the_plan_misses():
+    cache=PlanCache()
+    cache.put(QUERY,'simple',PLAN)
+    assert cache.get(QUERY.replace('summarize','translate')) is None
+    assert cache.get(QUERY.replace('summarize','delete')) is None
+    assert cache.stats()['misses']==2
+
+class Execution:
+    def __init__(self,output:str):
+        self.output=output
+
+    def invoke(self,state:dict)->dict:
+        return {**state,'output':self.output}
+
+@pytest.fixture
+def cache(monkeypatch)->PlanCache:
+    cache=PlanCache()
+    monkeypatch.setattr(plan_agent,'get_plan_cache',lambda:cache)
+    return cache
+
+@pytest.mark.parametrize('output,cacheable,stored',[('Done',True,True),('',True,False),('Done',False,False)])
+def test_plan_is_stored_after_it_answered(cache,output,cacheable,stored):
+    agent=PlanAgent(plan_cache=True)
+    agent.update_graph=lambda:Execution(output)
+    agent.execute({'input':QUERY,'plan_type':'advanced','plan':PLAN,'cacheable':cacheable,'output':''})
+    assert (cache.get(QUERY) is not None)==stored
+
+def test_plan_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv('PLAN_CACHE',raising=False)
+    assert not PlanAgent().plan_cache
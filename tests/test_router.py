@@ -0,0 +1,46 @@
+from src.inference.cascade import CascadeInference
+from src.router.local import get_local_router,router_stats
+from src.inference import BaseInference
+from src.message import AIMessage
+from src.router import LLMRouter
+
+# Route list in the format ToolAgent.router builds ('name' instead of 'route')
+TOOL_ROUTES=[
+    {'name':'update','description':'Update an existing tool.'},
+    {'name':'debug','description':'Fix errors of a tool.'},
+    {'name':'generate','description':'Create a new tool.'},
+    {'name':'delete','description':'Delete a tool.'},
+    {'name':'package','description':'Install a missing package.'},
+]
+
+class ScriptedLLM(BaseInference):
+    def __init__(self,route:str):
+        super().__init__(model='scripted')
+        self.route=route
+        self.calls=0
+
+    def invoke(self,messages,json=False,**kwargs)->AIMessage:
+        self.calls+=1
+        return AIMessage({'route':self.route,'confidence':1.0})
+
+def test_validate_accepts_tool_agent_routes():
+    router=LLMRouter(routes=TOOL_ROUTES,llm=ScriptedLLM('generate'))
+    assert router.route_names=={'update','debug','generate','delete','package'}
+    assert router.validate(AIMessage({'route':'generate'}))
+    assert not router.validate(AIMessage({'route':'unknown'}))
+
+def test_cascade_keeps_tool_agent_routing_on_the_small_model():
+    small,large=ScriptedLLM('generate'),ScriptedLLM('generate')
+    router=LLMRouter(routes=TOOL_ROUTES,llm=CascadeInference(small=small,large=large),mode='llm')
+    assert router.invoke('Create a tool that tells the time')=='generate'
+    assert (small.calls,large.calls)==(1,0)
+
+def test_local_router_learns_tool_agent_routes(monkeypatch,tmp_path):
+    monkeypatch.setenv('ROUTER_LOG',str(tmp_path/'router.history.jsonl'))
+    monkeypatch.setenv('ROUTER_AUDIT_RATE','0')
+    routes=[*TOOL_ROUTES,{'description':'A route without a name is skipped.'}]
+    local=get_local_router(routes)
+    assert local.routes==['update','debug','generate','delete','package']
+    local.record('Create a tool that tells the time','generate','llm')
+    assert local.predict('Create a tool that tells the weather')[0]=='generate'
+    assert 'update|debug|generate|delete|package' in router_stats()